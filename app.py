@@ -1,158 +1,3824 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, stream_with_context, g, has_request_context, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-from sqlalchemy import or_
+from datetime import datetime, timedelta
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import or_, event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects import postgresql, sqlite
 import os
+import functools
+import re
+import sqlite3
+import csv
+import json
+import gzip
+import hashlib
+import hmac
+import zlib
+import html
+import math
+import time
+import random
+import threading
+import click
+import tracemalloc
+import platform
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'dev-secret-key-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///game_tasks.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', 'sqlite:///game_tasks.db').replace('postgres://', 'postgresql://', 1)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DATABASE_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DATABASE_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True
+    }
+# Applied in order to every new SQLite connection; busy_timeout goes first so the
+# journal_mode switch waits for other connections instead of failing.
+app.config['SQLITE_PRAGMAS'] = {
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))
+}
+app.config['CHANGE_LOG_RETENTION'] = 5000
+app.config['EVENT_BROKER'] = os.environ.get('EVENT_BROKER', 'local')
+app.config['EVENT_HEARTBEAT_SECONDS'] = 15
+app.config['EVENT_RETRY_MS'] = 3000
+# Each open stream holds a server thread that sleeps on the broker while idle. Sized so a
+# team keeping boards open in a few tabs each stays on streams; the WSGI server needs at
+# least this many threads per worker. Past it, clients poll /api/tasks?since= instead
+app.config['EVENT_MAX_STREAMS'] = int(os.environ.get('EVENT_MAX_STREAMS', 256))
+app.config['EVENT_STREAM_MAX_SECONDS'] = 300
+app.config['EVENT_POLL_SECONDS'] = 5
+app.config['BATCH_INCREMENTAL_LIMIT'] = 200
+app.config['SUBGRAPH_DEFAULT_DEPTH'] = 10
+app.config['SUBGRAPH_MAX_DEPTH'] = 100
+app.config['SUBGRAPH_MAX_NODES'] = 1000
+app.config['HISTORY_PAGE_SIZE'] = 20
+app.config['DASHBOARD_CACHE_SIZE'] = 512
+app.config['DASHBOARD_MAX_CHANGES'] = 500
+app.config['TASK_WRITE_RETRIES'] = 3
+# Seconds clients are told to wait when the database stays locked past its busy timeout
+app.config['DATABASE_BUSY_RETRY_AFTER'] = 1
+# Re-parenting a task with a bigger subtree than this leaves depths to a background recompute
+app.config['DEPTH_REFRESH_INLINE_LIMIT'] = 2000
+app.config['JOB_WORKERS'] = 2
+app.config['JOB_RETENTION_DAYS'] = 7
+app.config['JOB_CANCEL_POLL_SECONDS'] = 1
+app.config['JOB_EXPORT_DIR'] = os.path.join(app.instance_path, 'exports')
+app.config['PRINCIPAL_CACHE_SIZE'] = 1024
+app.config['PRINCIPAL_CACHE_TTL'] = 60
+app.config['PASSWORD_HASH_WORKERS'] = 2
+app.config['PASSWORD_HASH_BACKLOG'] = 0
+app.config['PASSWORD_HASH_RETRY_AFTER'] = 1
+app.config['JSON_ENCODER'] = 'orjson' if orjson else 'stdlib'
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_LEVEL'] = 6
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['N_PLUS_ONE_THRESHOLD'] = None
+app.config['QUERY_DEBUG_HEADERS'] = False
+
+db = SQLAlchemy(app)
+login_manager = LoginManager(app)
+login_manager.login_view = 'login'
+
+# ==================== STATUS RULES ====================
+
+STATUS_ORDER = ['not_started', 'started', 'functional', 'documented', 'integrated']
+STATUS_PROGRESSION = {
+    'not_started': 'started',
+    'started': 'functional',
+    'functional': 'documented',
+    'documented': 'integrated'
+}
+
+def compute_progress(status, child_statuses):
+    if not child_statuses:
+        return 100 if status == 'integrated' else 0
+    total = len(child_statuses)
+    completed = sum(1 for child_status in child_statuses if child_status == 'integrated')
+    return int((completed / total) * 100)
+
+def compute_importance_weight(depth, child_count):
+    return depth * 10 + child_count * 2
+
+def count_unfinished_statuses(child_statuses):
+    functional_index = STATUS_ORDER.index('functional')
+    return sum(1 for child_status in child_statuses if STATUS_ORDER.index(child_status) < functional_index)
+
+def has_unfinished_statuses(child_statuses):
+    return count_unfinished_statuses(child_statuses) > 0
+
+def remaining_steps(status):
+    return len(STATUS_ORDER) - 1 - STATUS_ORDER.index(status)
+
+def compute_next_status_highlight(status, assignee_id, override_warning, child_statuses, current_user_id=None):
+    if assignee_id and assignee_id != current_user_id:
+        return None
+    if child_statuses:
+        if not has_unfinished_statuses(child_statuses):
+            return STATUS_PROGRESSION.get(status)
+    elif not override_warning:
+        return STATUS_PROGRESSION.get(status)
+    return None
+
+def check_status_change(new_status, children, override_warning=False):
+    """Check a status change against the task's direct children, given as (title, status) pairs.
+
+    Returns None if the change may go ahead, otherwise (message, warning).
+    Warnings are about unfinished children and are skipped with override_warning;
+    integrating over children that are not integrated is always refused.
+    """
+    if has_unfinished_statuses([status for _, status in children]) and not override_warning:
+        non_functional = [title for title, status in children if status not in ['functional', 'documented', 'integrated']]
+        message = f'This task has unfinished children: {", ".join(non_functional[:3])}'
+        if len(non_functional) > 3:
+            message += f' and {len(non_functional) - 3} more'
+        return message + '. Are you sure you want to proceed?', True
+    if children and new_status == 'integrated':
+        non_integrated = [title for title, status in children if status != 'integrated']
+        if non_integrated:
+            message = f'Cannot integrate while children are not integrated: {", ".join(non_integrated[:3])}'
+            if len(non_integrated) > 3:
+                message += f' and {len(non_integrated) - 3} more'
+            return message, False
+    return None
+
+# ==================== MODELS ====================
+
+# Association table for many-to-many parent-child relationships
+task_parents = db.Table('task_parents',
+    db.Column('parent_id', db.Integer, db.ForeignKey('task.id'), primary_key=True),
+    db.Column('child_id', db.Integer, db.ForeignKey('task.id'), primary_key=True),
+    # Reverse edge index: the primary key only serves lookups by parent_id
+    db.Index('ix_task_parents_child_id_parent_id', 'child_id', 'parent_id')
+)
+
+# Transitive closure of task_parents: one row per (ancestor, descendant) pair
+task_closure = db.Table('task_closure',
+    db.Column('ancestor_id', db.Integer, db.ForeignKey('task.id'), primary_key=True),
+    db.Column('descendant_id', db.Integer, db.ForeignKey('task.id'), primary_key=True, index=True)
+)
+
+# Flow analytics rollups, folded from status_history as transitions are written.
+# Dwell time is credited to the status being left, in the week it is left.
+flow_status_week = db.Table('flow_status_week',
+    db.Column('week', db.Date, primary_key=True),
+    db.Column('status', db.String(20), primary_key=True),
+    db.Column('entered', db.Integer, nullable=False, default=0),
+    db.Column('exited', db.Integer, nullable=False, default=0),
+    db.Column('dwell_seconds', db.Float, nullable=False, default=0)
+)
+
+# One row per task that has left not_started; completed_at is set while it is integrated
+flow_cycle = db.Table('flow_cycle',
+    db.Column('task_id', db.Integer, db.ForeignKey('task.id'), primary_key=True),
+    db.Column('started_at', db.DateTime),
+    db.Column('completed_at', db.DateTime, index=True),
+    db.Column('cycle_seconds', db.Float)
+)
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(200), nullable=False)
+    role = db.Column(db.String(20), default='developer')
+    created_tasks = db.relationship('Task', foreign_keys='Task.creator_id', backref='creator')
+    assigned_tasks = db.relationship('Task', foreign_keys='Task.assignee_id', backref='assignee')
+
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+
+class Task(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    assignee_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    status = db.Column(db.String(20), default='not_started', index=True)
+    override_warning = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Materialized rollups, maintained by refresh_rollups/refresh_depths
+    depth = db.Column(db.Integer, default=0)
+    child_count = db.Column(db.Integer, default=0)
+    importance_weight = db.Column(db.Integer, default=0)
+    progress = db.Column(db.Integer, default=0)
+    # Children below functional; the ready frontier is every unfinished task where this is 0
+    unfinished_children = db.Column(db.Integer, default=0)
+    # Row version for optimistic concurrency: every ORM UPDATE/DELETE checks and bumps it
+    version = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version}
+    __table_args__ = (db.Index('ix_task_frontier', 'unfinished_children', 'status'),)
+    
+    parents = db.relationship('Task',
+        secondary=task_parents,
+        primaryjoin=(task_parents.c.child_id == id),
+        secondaryjoin=(task_parents.c.parent_id == id),
+        backref=db.backref('children', lazy='dynamic'),
+        lazy='dynamic'
+    )
+    
+    documentation = db.relationship('Documentation', backref='task', uselist=False, cascade='all, delete-orphan')
+    status_history = db.relationship('StatusHistory', backref='task', cascade='all, delete-orphan')
+
+    def get_depth(self):
+        return self.depth
+
+    def get_importance_weight(self):
+        return self.importance_weight
+
+    def get_progress(self):
+        return self.progress
+
+    def can_edit(self, user):
+        return user.role == 'admin' or user.id == self.creator_id or user.id == self.assignee_id
+
+    def has_circular_relationship(self, potential_parent_id):
+        return creates_cycle(potential_parent_id, self.id)
+
+    def has_unfinished_children(self):
+        return has_unfinished_statuses([child.status for child in self.children.all()])
+
+    def get_next_status_highlight(self, current_user_id=None):
+        return compute_next_status_highlight(
+            self.status, self.assignee_id, self.override_warning,
+            [child.status for child in self.children.all()], current_user_id
+        )
+
+class Documentation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False, index=True)
+    content = db.Column(db.Text)
+    template_hint = db.Column(db.Text, default="List any externally accessible features here.\n\n\nVariables:\n\nFunctions:\n\nExample use cases:\n")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class StatusHistory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False, index=True)
+    old_status = db.Column(db.String(20))
+    new_status = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    user = db.relationship('User')
+
+class ChangeLog(db.Model):
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    task_id = db.Column(db.Integer)
+    parent_id = db.Column(db.Integer)
+    child_id = db.Column(db.Integer)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SchemaMigration(db.Model):
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    # Queued jobs with the same key are coalesced into one run
+    __table_args__ = (db.Index('ix_job_key_status', 'key', 'status'),)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    key = db.Column(db.String(200), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    params = db.Column(db.Text)
+    progress = db.Column(db.Float, nullable=False, default=0)
+    message = db.Column(db.String(200))
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime, index=True)
+
+# ==================== AUTH ====================
+
+class Principal(UserMixin):
+    """Read-only snapshot of a User for current_user, safe to share across requests."""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.role = user.role
+
+class PrincipalCache:
+    """LRU cache of Principals by user id, with entries expiring after a TTL.
+
+    Routes that change a user invalidate it here; the TTL bounds how long
+    other worker processes can keep serving a stale role or a deleted user.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        user = db.session.get(User, user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        principal = Principal(user)
+        self.put(principal)
+        return principal
+
+    def put(self, principal):
+        with self.lock:
+            self.entries[principal.id] = (principal, time.monotonic() + app.config['PRINCIPAL_CACHE_TTL'])
+            self.entries.move_to_end(principal.id)
+            while len(self.entries) > app.config['PRINCIPAL_CACHE_SIZE']:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
+
+principal_cache = PrincipalCache()
+
+@login_manager.user_loader
+def load_user(user_id):
+    return principal_cache.get(int(user_id))
+
+class PasswordHasher:
+    """Runs password hashing on a small thread pool so logins cannot tie up every request thread.
+
+    The calling request thread still waits for its own hash, so the pool bounds
+    how many request threads hashing can hold: PASSWORD_HASH_WORKERS running
+    plus PASSWORD_HASH_BACKLOG queued. Beyond that, callers get TimeoutError at
+    once instead of waiting for a slot.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.slots = None
+        self.completed = 0
+        self.rejected = 0
+
+    def run(self, func, *args):
+        with self.lock:
+            if self.executor is None:
+                workers = app.config['PASSWORD_HASH_WORKERS']
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+                self.slots = threading.BoundedSemaphore(workers + app.config['PASSWORD_HASH_BACKLOG'])
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise TimeoutError('Password hashing is saturated')
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(self.finished)
+        return future.result()
+
+    def finished(self, future):
+        self.slots.release()
+        with self.lock:
+            self.completed += 1
+
+    def check(self, password_hash, password):
+        return self.run(check_password_hash, password_hash, password)
+
+    def generate(self, password):
+        return self.run(generate_password_hash, password)
+
+    def stats(self):
+        with self.lock:
+            return {'workers': app.config['PASSWORD_HASH_WORKERS'], 'completed': self.completed,
+                    'rejected': self.rejected}
+
+password_hasher = PasswordHasher()
+
+def hasher_busy_response(response):
+    """503 with Retry-After for a request turned away by a saturated password hasher."""
+    response = app.make_response(response)
+    response.status_code = 503
+    response.headers['Retry-After'] = str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+    return response
+
+# ==================== GRAPH SNAPSHOT ====================
+
+def load_graph(task_ids=None):
+    """Load tasks, their edges and usernames in a fixed number of bulk queries.
+
+    With task_ids, only those tasks are loaded, along with the statuses of their
+    neighbours. Returns (tasks, parent_ids, child_ids, statuses, usernames).
+    Adjacency lists are sorted by id, matching what the indexed lazy
+    relationships return, so callers never need to touch them.
+    """
+    task_query = Task.query.order_by(Task.id)
+    edges = db.session.query(task_parents.c.parent_id, task_parents.c.child_id)
+    if task_ids is not None:
+        task_query = task_query.filter(Task.id.in_(task_ids))
+        edges = edges.filter(or_(task_parents.c.parent_id.in_(task_ids),
+                                 task_parents.c.child_id.in_(task_ids)))
+    tasks = task_query.all()
+    edges = edges.all()
+    if task_ids is None:
+        statuses = {t.id: t.status for t in tasks}
+    else:
+        neighbour_ids = {task_id for edge in edges for task_id in edge}
+        statuses = dict(db.session.query(Task.id, Task.status).filter(
+            Task.id.in_(neighbour_ids | {t.id for t in tasks})))
+    parent_ids = defaultdict(list)
+    child_ids = defaultdict(list)
+    for parent_id, child_id in edges:
+        if parent_id in statuses and child_id in statuses:
+            parent_ids[child_id].append(parent_id)
+            child_ids[parent_id].append(child_id)
+    for ids in list(parent_ids.values()) + list(child_ids.values()):
+        ids.sort()
+    usernames = dict(db.session.query(User.id, User.username).all())
+    return tasks, parent_ids, child_ids, statuses, usernames
+
+def serialize_task_summary(t, parent_ids, child_ids, statuses, usernames, user):
+    child_statuses = [statuses[child_id] for child_id in child_ids]
+    return {
+        'id': t.id,
+        'title': t.title,
+        'description': t.description,
+        'parent_ids': parent_ids,
+        'child_ids': child_ids,
+        'status': t.status,
+        'assignee': usernames.get(t.assignee_id) if t.assignee_id else None,
+        'assignee_id': t.assignee_id,
+        'creator': usernames.get(t.creator_id),
+        'progress': t.progress,
+        'created_at': t.created_at.isoformat(),
+        'can_edit': t.can_edit(user),
+        'next_status_highlight': compute_next_status_highlight(
+            t.status, t.assignee_id, t.override_warning, child_statuses, user.id
+        ),
+        'override_warning': t.override_warning,
+        'version': t.version
+    }
+
+def build_task_snapshot(user, task_ids=None):
+    tasks, parent_ids, child_ids, statuses, usernames = load_graph(task_ids)
+    return [serialize_task_summary(t, parent_ids[t.id], child_ids[t.id], statuses, usernames, user)
+            for t in tasks]
+
+# ==================== CHANGE LOG ====================
+
+def record_change(kind, task_id=None, parent_id=None, child_id=None):
+    """Append a graph mutation to the change log as part of the current transaction."""
+    record_changes([ChangeLog(kind=kind, task_id=task_id, parent_id=parent_id, child_id=child_id)])
+
+# Arbitrary application-wide key for pg_advisory_xact_lock
+CHANGE_LOG_LOCK_KEY = 0x70726a74
+
+def record_changes(entries):
+    """Add change log entries, keeping ids in commit order.
+
+    Readers treat the highest id as the graph version and resume from it with a
+    strict `id > since`. SQLite writers are already serialized by the database
+    lock; on PostgreSQL concurrent transactions could commit sequence ids out
+    of order, so writers take a transaction-scoped advisory lock before their
+    first entry is inserted and hold it until commit. Old entries are pruned
+    once, when the transaction commits.
+    """
+    if db.engine.dialect.name == 'postgresql' and not db.session.info.get('change_log_locked'):
+        db.session.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': CHANGE_LOG_LOCK_KEY})
+        db.session.info['change_log_locked'] = True
+    db.session.add_all(entries)
+    db.session.info['prune_change_log'] = True
+
+@event.listens_for(Session, 'before_commit')
+def prune_change_log(session):
+    """Keep the last CHANGE_LOG_RETENTION entries, in the transaction that logged new ones."""
+    if not session.info.pop('prune_change_log', False):
+        return
+    session.flush()
+    retention = app.config['CHANGE_LOG_RETENTION']
+    latest = session.query(db.func.max(ChangeLog.id)).scalar()
+    if latest and latest > retention:
+        session.execute(ChangeLog.__table__.delete().where(ChangeLog.id <= latest - retention))
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def release_change_log_lock(session):
+    session.info.pop('change_log_locked', None)
+    session.info.pop('prune_change_log', None)
+
+# Changes that touch an unbounded set of tasks, so clients reload everything. Every
+# rebuild of derived data logs one, so the graph version (and every ETag) moves on.
+FULL_REFRESH_CHANGES = ('user_changed', 'rollups_recomputed', 'data_rebuilt')
+
+def get_graph_version():
+    return db.session.query(db.func.max(ChangeLog.id)).scalar() or 0
+
+def has_changes_since(since, kinds):
+    """True if a change of one of `kinds` was logged after `since`, or if that can no longer be told."""
+    oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+    if oldest is not None and since < oldest - 1:
+        return True
+    return db.session.query(db.exists().where(ChangeLog.id > since, ChangeLog.kind.in_(kinds))).scalar()
+
+def build_task_delta(user, since):
+    """Return the tasks and edges that changed after version `since`.
+
+    Falls back to a full snapshot when the client is ahead of the server, when
+    the entries it needs have been pruned, or when a user was renamed or removed
+    (which touches the assignee/creator name of arbitrarily many tasks), or when
+    a background rollup recompute rewrote progress and depth everywhere.
+    """
+    version = get_graph_version()
+    oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+    entries = ChangeLog.query.filter(ChangeLog.id > since).order_by(ChangeLog.id).all()
+    needs_full = (
+        since > version
+        or (oldest is not None and since < oldest - 1)
+        or len(entries) >= app.config['CHANGE_LOG_RETENTION']
+        or any(e.kind in FULL_REFRESH_CHANGES for e in entries)
+    )
+    if needs_full:
+        return {'version': version, 'full': True, 'tasks': build_task_snapshot(user)}
+
+    affected = set()
+    changed = set()
+    deleted = set()
+    edge_changes = {}
+    for e in entries:
+        if e.kind in ('edge_added', 'edge_removed'):
+            affected.update((e.parent_id, e.child_id))
+            edge_changes[(e.parent_id, e.child_id)] = e.kind
+        elif e.kind == 'task_deleted':
+            deleted.add(e.task_id)
+        else:
+            changed.add(e.task_id)
+    if changed:
+        # A child's status feeds its parents' progress and highlight
+        affected.update(parent_id for parent_id, in db.session.query(task_parents.c.parent_id).filter(
+            task_parents.c.child_id.in_(changed)))
+    affected |= changed
+    tasks = build_task_snapshot(user, affected | deleted) if affected or deleted else []
+    present = {t['id'] for t in tasks}
+    return {
+        'version': version,
+        'full': False,
+        'tasks': tasks,
+        'removed_task_ids': sorted((affected | deleted) - present),
+        'edges_added': [list(edge) for edge, kind in edge_changes.items() if kind == 'edge_added'],
+        'edges_removed': [list(edge) for edge, kind in edge_changes.items() if kind == 'edge_removed']
+    }
+
+# ==================== REACHABILITY INDEX ====================
+
+def get_ancestor_ids(task_id):
+    return {row[0] for row in db.session.query(task_closure.c.ancestor_id).filter(
+        task_closure.c.descendant_id == task_id)}
+
+def get_descendant_ids(task_id):
+    return {row[0] for row in db.session.query(task_closure.c.descendant_id).filter(
+        task_closure.c.ancestor_id == task_id)}
+
+def creates_cycle(parent_id, child_id):
+    """True if making child_id a child of parent_id would close a loop."""
+    if parent_id == child_id:
+        return True
+    return db.session.query(db.exists().where(
+        task_closure.c.ancestor_id == child_id,
+        task_closure.c.descendant_id == parent_id
+    )).scalar()
+
+def index_edge_added(parent_id, child_id):
+    sources = get_ancestor_ids(parent_id) | {parent_id}
+    targets = get_descendant_ids(child_id) | {child_id}
+    existing = set(db.session.query(task_closure.c.ancestor_id, task_closure.c.descendant_id).filter(
+        task_closure.c.ancestor_id.in_(sources), task_closure.c.descendant_id.in_(targets)))
+    rows = [{'ancestor_id': a, 'descendant_id': d}
+            for a in sources for d in targets if (a, d) not in existing]
+    if rows:
+        db.session.execute(task_closure.insert(), rows)
+
+def index_edge_removed(parent_id, child_id):
+    """Drop the pairs that only existed through the removed edge.
+
+    Only ancestors of the parent can lose reachability, and only to the child's
+    descendants, so reachability is re-derived for that block alone, bottom-up
+    over the remaining edges.
+    """
+    sources = get_ancestor_ids(parent_id) | {parent_id}
+    targets = get_descendant_ids(child_id) | {child_id}
+    children_of = defaultdict(set)
+    for p, c in db.session.query(task_parents.c.parent_id, task_parents.c.child_id).filter(
+            task_parents.c.parent_id.in_(sources)):
+        children_of[p].add(c)
+    outside = {c for children in children_of.values() for c in children} - sources
+    outside_reach = defaultdict(set)
+    for a, d in db.session.query(task_closure.c.ancestor_id, task_closure.c.descendant_id).filter(
+            task_closure.c.ancestor_id.in_(outside), task_closure.c.descendant_id.in_(targets)):
+        outside_reach[a].add(d)
+    pending = {a: len(children_of[a] & sources) for a in sources}
+    parents_in_sources = defaultdict(list)
+    for a in sources:
+        for c in children_of[a] & sources:
+            parents_in_sources[c].append(a)
+    ready = [a for a, count in pending.items() if count == 0]
+    reach = {}
+    while ready:
+        a = ready.pop()
+        reach[a] = set()
+        for c in children_of[a]:
+            if c in targets:
+                reach[a].add(c)
+            reach[a] |= reach[c] if c in sources else outside_reach[c]
+        for p in parents_in_sources[a]:
+            pending[p] -= 1
+            if pending[p] == 0:
+                ready.append(p)
+    for a in sources:
+        stale = targets - reach.get(a, set())
+        if stale:
+            db.session.execute(task_closure.delete().where(
+                task_closure.c.ancestor_id == a, task_closure.c.descendant_id.in_(stale)))
+
+def index_task_removed(task_id):
+    db.session.execute(task_closure.delete().where(or_(
+        task_closure.c.ancestor_id == task_id, task_closure.c.descendant_id == task_id)))
+
+def link_tasks(parent, child):
+    child.parents.append(parent)
+    db.session.flush()
+    index_edge_added(parent.id, child.id)
+    refresh_rollups([parent.id])
+    refresh_depths(child.id, defer_over=app.config['DEPTH_REFRESH_INLINE_LIMIT'])
+    record_change('edge_added', parent_id=parent.id, child_id=child.id)
+
+def unlink_tasks(parent, child):
+    child.parents.remove(parent)
+    db.session.flush()
+    index_edge_removed(parent.id, child.id)
+    refresh_rollups([parent.id])
+    refresh_depths(child.id, defer_over=app.config['DEPTH_REFRESH_INLINE_LIMIT'])
+    record_change('edge_removed', parent_id=parent.id, child_id=child.id)
+
+def compute_closure():
+    """Derive every (ancestor, descendant) pair from task_parents in memory.
+
+    Raises ValueError listing the offending task ids if the graph has a cycle.
+    """
+    task_ids = [row[0] for row in db.session.query(Task.id)]
+    children_of = defaultdict(set)
+    parents_of = defaultdict(set)
+    for p, c in db.session.query(task_parents.c.parent_id, task_parents.c.child_id):
+        children_of[p].add(c)
+        parents_of[c].add(p)
+    pending = {t: len(children_of[t]) for t in task_ids}
+    ready = [t for t, count in pending.items() if count == 0]
+    descendants = {}
+    while ready:
+        t = ready.pop()
+        descendants[t] = set(children_of[t])
+        for c in children_of[t]:
+            descendants[t] |= descendants[c]
+        for p in parents_of[t]:
+            pending[p] -= 1
+            if pending[p] == 0:
+                ready.append(p)
+    if len(descendants) < len(task_ids):
+        raise ValueError(f'Task graph has a cycle through tasks {sorted(set(task_ids) - set(descendants))}')
+    return {(a, d) for a, ds in descendants.items() for d in ds}
+
+def rebuild_closure():
+    pairs = compute_closure()
+    db.session.execute(task_closure.delete())
+    if pairs:
+        db.session.execute(task_closure.insert(), [{'ancestor_id': a, 'descendant_id': d} for a, d in pairs])
+    record_change('data_rebuilt')
+    return len(pairs)
+
+def verify_closure():
+    """Return (missing, extra) pairs between the stored index and task_parents."""
+    expected = compute_closure()
+    stored = set(db.session.query(task_closure.c.ancestor_id, task_closure.c.descendant_id))
+    return expected - stored, stored - expected
+
+@app.cli.command('rebuild-closure')
+def rebuild_closure_command():
+    """Rebuild the task reachability index from task_parents."""
+    try:
+        count = rebuild_closure()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(f'Indexed {count} ancestor/descendant pairs')
+
+@app.cli.command('verify-closure')
+def verify_closure_command():
+    """Check the task reachability index against task_parents."""
+    try:
+        missing, extra = verify_closure()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for a, d in sorted(missing):
+        click.echo(f'missing: {a} -> {d}')
+    for a, d in sorted(extra):
+        click.echo(f'extra: {a} -> {d}')
+    if missing or extra:
+        raise click.ClickException(f'{len(missing)} missing and {len(extra)} extra pairs; run flask rebuild-closure')
+    click.echo('Reachability index is consistent')
+
+# ==================== ROLLUPS ====================
+
+def write_rollups(rows):
+    """Bulk-write rollup columns without bumping updated_at.
+
+    Each row is a dict with 'task_id' plus the columns to set; all rows must
+    carry the same columns.
+    """
+    if not rows:
+        return
+    db.session.flush()
+    table = Task.__table__
+    fields = [key for key in rows[0] if key != 'task_id']
+    statement = table.update().where(table.c.id == db.bindparam('row_task_id')).values(
+        updated_at=table.c.updated_at,
+        **{field: db.bindparam(f'row_{field}') for field in fields}
+    )
+    db.session.execute(statement, [{f'row_{key}': value for key, value in row.items()} for row in rows])
+
+def refresh_rollups(task_ids):
+    """Recompute child count, progress, importance weight and unfinished children from direct children."""
+    task_ids = set(task_ids)
+    if not task_ids:
+        return
+    db.session.flush()
+    child_statuses = defaultdict(list)
+    children = db.session.query(task_parents.c.parent_id, Task.status).join(
+        Task, Task.id == task_parents.c.child_id).filter(task_parents.c.parent_id.in_(task_ids))
+    for parent_id, status in children:
+        child_statuses[parent_id].append(status)
+    rows = []
+    for task_id, status, depth, child_count, progress, weight, unfinished in db.session.query(
+            Task.id, Task.status, Task.depth, Task.child_count, Task.progress, Task.importance_weight,
+            Task.unfinished_children
+    ).filter(Task.id.in_(task_ids)):
+        statuses = child_statuses[task_id]
+        new = (len(statuses), compute_progress(status, statuses),
+               compute_importance_weight(depth or 0, len(statuses)), count_unfinished_statuses(statuses))
+        if new != (child_count, progress, weight, unfinished):
+            rows.append({'task_id': task_id, 'child_count': new[0], 'progress': new[1],
+                         'importance_weight': new[2], 'unfinished_children': new[3]})
+    write_rollups(rows)
+
+def refresh_depths(task_id, defer_over=None):
+    """Recompute depth for task_id and its descendants, parents before children.
+
+    With defer_over, a subtree bigger than that is left to a background
+    rollup recompute instead, queued to start once the transaction commits.
+    """
+    db.session.flush()
+    scope = get_descendant_ids(task_id) | {task_id}
+    if defer_over is not None and len(scope) > defer_over:
+        enqueue_job('recompute_rollups')
+        return
+    parents_of = defaultdict(set)
+    for p, c in db.session.query(task_parents.c.parent_id, task_parents.c.child_id).filter(
+            task_parents.c.child_id.in_(scope)):
+        parents_of[c].add(p)
+    outside = {p for parents in parents_of.values() for p in parents} - scope
+    depths = dict(db.session.query(Task.id, Task.depth).filter(Task.id.in_(outside)))
+    current = {task_id: (depth, child_count) for task_id, depth, child_count in db.session.query(
+        Task.id, Task.depth, Task.child_count).filter(Task.id.in_(scope))}
+    children_in_scope = defaultdict(list)
+    pending = {}
+    for t in current:
+        in_scope = parents_of[t] & scope
+        pending[t] = len(in_scope)
+        for p in in_scope:
+            children_in_scope[p].append(t)
+    ready = [t for t, count in pending.items() if count == 0]
+    rows = []
+    while ready:
+        t = ready.pop()
+        depths[t] = max(((depths[p] or 0) + 1 for p in parents_of[t]), default=0)
+        depth, child_count = current[t]
+        if depths[t] != depth:
+            rows.append({'task_id': t, 'depth': depths[t],
+                         'importance_weight': compute_importance_weight(depths[t], child_count or 0)})
+        for c in children_in_scope[t]:
+            pending[c] -= 1
+            if pending[c] == 0:
+                ready.append(c)
+    write_rollups(rows)
+
+def recompute_rollups():
+    """Recompute every rollup column from scratch: longest path over a topological sort, O(V+E)."""
+    tasks = db.session.query(Task.id, Task.status).all()
+    statuses = dict(tasks)
+    children_of = defaultdict(list)
+    parents_of = defaultdict(list)
+    for p, c in db.session.query(task_parents.c.parent_id, task_parents.c.child_id):
+        if p in statuses and c in statuses:
+            children_of[p].append(c)
+            parents_of[c].append(p)
+    pending = {t: len(parents_of[t]) for t in statuses}
+    ready = [t for t, count in pending.items() if count == 0]
+    depths = {}
+    while ready:
+        t = ready.pop()
+        depths[t] = max((depths[p] + 1 for p in parents_of[t]), default=0)
+        for c in children_of[t]:
+            pending[c] -= 1
+            if pending[c] == 0:
+                ready.append(c)
+    if len(depths) < len(statuses):
+        raise ValueError(f'Task graph has a cycle through tasks {sorted(set(statuses) - set(depths))}')
+    rows = []
+    for t, status in statuses.items():
+        child_statuses = [statuses[c] for c in children_of[t]]
+        rows.append({
+            'task_id': t,
+            'depth': depths[t],
+            'child_count': len(child_statuses),
+            'progress': compute_progress(status, child_statuses),
+            'importance_weight': compute_importance_weight(depths[t], len(child_statuses)),
+            'unfinished_children': count_unfinished_statuses(child_statuses)
+        })
+    write_rollups(rows)
+    record_change('rollups_recomputed')
+    return len(rows)
+
+def refresh_rollups_since(version):
+    """Re-run the incremental rollup refresh for the changes logged after `version`."""
+    oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+    if oldest is not None and version < oldest - 1:
+        recompute_rollups()
+        return
+    touched = set()
+    moved = set()
+    for kind, task_id, parent_id, child_id in db.session.query(
+            ChangeLog.kind, ChangeLog.task_id, ChangeLog.parent_id, ChangeLog.child_id).filter(ChangeLog.id > version):
+        if kind in ('edge_added', 'edge_removed'):
+            touched.add(parent_id)
+            moved.add(child_id)
+        elif kind in ('task_created', 'task_status'):
+            touched.add(task_id)
+    if touched:
+        touched.update(parent_id for parent_id, in db.session.query(task_parents.c.parent_id).filter(
+            task_parents.c.child_id.in_(touched)))
+        refresh_rollups(touched)
+    for task_id in moved:
+        if db.session.get(Task, task_id) is not None:
+            refresh_depths(task_id)
+
+@app.cli.command('recompute-rollups')
+def recompute_rollups_command():
+    """Recompute depth, child count, importance weight, progress and unfinished children for every task."""
+    try:
+        count = recompute_rollups()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(f'Recomputed rollups for {count} tasks')
+
+# ==================== FLOW ANALYTICS ====================
+
+WIP_STATUSES = STATUS_ORDER[1:-1]
+
+def week_start(moment):
+    return (moment - timedelta(days=moment.weekday())).date()
+
+def upsert(table):
+    """Dialect INSERT that supports on_conflict_do_update (SQLite and PostgreSQL)."""
+    return (postgresql if db.engine.dialect.name == 'postgresql' else sqlite).insert(table)
+
+def fold_transition(weekly, cycles, task_id, old_status, new_status, entered_at, at):
+    """Add one status change to in-memory weekly totals and per-task cycle state."""
+    left = weekly[(week_start(at), old_status)]
+    left[1] += 1
+    left[2] += (at - entered_at).total_seconds()
+    weekly[(week_start(at), new_status)][0] += 1
+    started_at, _ = cycles.get(task_id, (None, None))
+    if started_at is None and old_status == 'not_started':
+        started_at = at
+    cycles[task_id] = (started_at, at if new_status == 'integrated' else None)
+
+def write_flow_rollups(weekly, cycles, sign=1):
+    if weekly:
+        insert = upsert(flow_status_week)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=['week', 'status'],
+            set_={name: flow_status_week.c[name] + insert.excluded[name]
+                  for name in ('entered', 'exited', 'dwell_seconds')}
+        ), [{'week': week, 'status': status, 'entered': sign * entered, 'exited': sign * exited,
+             'dwell_seconds': sign * dwell} for (week, status), (entered, exited, dwell) in weekly.items()])
+    if cycles:
+        insert = upsert(flow_cycle)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=['task_id'],
+            set_={name: insert.excluded[name] for name in ('started_at', 'completed_at', 'cycle_seconds')}
+        ), [{'task_id': task_id, 'started_at': started_at, 'completed_at': completed_at,
+             'cycle_seconds': (completed_at - started_at).total_seconds() if started_at and completed_at else None}
+            for task_id, (started_at, completed_at) in cycles.items()])
+
+def record_flow_transitions(transitions):
+    """Fold new (task_id, old_status, new_status, at) changes into the flow rollups.
+
+    Call before the matching StatusHistory rows are added to the session, so
+    the latest stored row for each task is still the previous transition.
+    """
+    task_ids = {transition[0] for transition in transitions}
+    if not task_ids:
+        return
+    last = dict(db.session.query(StatusHistory.task_id, db.func.max(StatusHistory.timestamp)).filter(
+        StatusHistory.task_id.in_(task_ids)).group_by(StatusHistory.task_id))
+    created = dict(db.session.query(Task.id, Task.created_at).filter(Task.id.in_(task_ids)))
+    cycles = {task_id: (started_at, completed_at) for task_id, started_at, completed_at in db.session.query(
+        flow_cycle.c.task_id, flow_cycle.c.started_at, flow_cycle.c.completed_at).filter(
+        flow_cycle.c.task_id.in_(task_ids))}
+    weekly = defaultdict(lambda: [0, 0, 0.0])
+    for task_id, old_status, new_status, at in transitions:
+        fold_transition(weekly, cycles, task_id, old_status, new_status,
+                        last.get(task_id) or created.get(task_id) or at, at)
+        last[task_id] = at
+    write_flow_rollups(weekly, cycles)
+
+def fold_history(task_ids=None):
+    """Replay stored history into (weekly, cycles), pairing each row with the previous one via LAG."""
+    entered_at = db.func.coalesce(db.func.lag(StatusHistory.timestamp, type_=db.DateTime).over(
+        partition_by=StatusHistory.task_id, order_by=(StatusHistory.timestamp, StatusHistory.id)), Task.created_at)
+    query = db.session.query(StatusHistory.task_id, StatusHistory.old_status, StatusHistory.new_status,
+                             StatusHistory.timestamp, entered_at).join(Task, Task.id == StatusHistory.task_id)
+    if task_ids is not None:
+        query = query.filter(StatusHistory.task_id.in_(task_ids))
+    weekly = defaultdict(lambda: [0, 0, 0.0])
+    cycles = {}
+    for task_id, old_status, new_status, at, entered in query.order_by(
+            StatusHistory.task_id, StatusHistory.timestamp, StatusHistory.id).yield_per(5000):
+        fold_transition(weekly, cycles, task_id, old_status, new_status, entered or at, at)
+    return weekly, cycles
+
+def remove_task_flow(task_id):
+    """Take a task's history back out of the flow rollups before it is deleted."""
+    weekly, _ = fold_history([task_id])
+    write_flow_rollups(weekly, {}, sign=-1)
+    db.session.execute(flow_cycle.delete().where(flow_cycle.c.task_id == task_id))
+
+def rebuild_flow_rollups():
+    db.session.execute(flow_status_week.delete())
+    db.session.execute(flow_cycle.delete())
+    weekly, cycles = fold_history()
+    write_flow_rollups(weekly, cycles)
+    record_change('data_rebuilt')
+    return len(cycles)
+
+def flow_analytics(weeks):
+    """Dwell time, cycle time, weekly throughput and current WIP over the last `weeks` weeks."""
+    since = week_start(datetime.utcnow()) - timedelta(weeks=weeks - 1)
+    dwell = [{
+        'status': status,
+        'transitions': int(exited),
+        'total_hours': round(seconds / 3600, 2),
+        'average_hours': round(seconds / exited / 3600, 2) if exited else None
+    } for status, exited, seconds in db.session.query(
+        flow_status_week.c.status, db.func.sum(flow_status_week.c.exited),
+        db.func.sum(flow_status_week.c.dwell_seconds)
+    ).filter(flow_status_week.c.week >= since).group_by(flow_status_week.c.status)
+        if status in STATUS_ORDER and exited]
+    dwell.sort(key=lambda row: STATUS_ORDER.index(row['status']))
+
+    seconds = flow_cycle.c.cycle_seconds
+    ranked = db.select(
+        seconds,
+        db.func.row_number().over(order_by=seconds).label('rank'),
+        db.func.count().over().label('total')
+    ).where(flow_cycle.c.completed_at >= since, seconds.isnot(None)).subquery()
+    completed, average, median, p85 = db.session.execute(db.select(
+        db.func.count(),
+        db.func.avg(ranked.c.cycle_seconds),
+        db.func.avg(db.case((ranked.c.rank.in_([(ranked.c.total + 1) // 2, (ranked.c.total + 2) // 2]),
+                             ranked.c.cycle_seconds))),
+        db.func.max(db.case((ranked.c.rank == (ranked.c.total * 85 + 99) // 100, ranked.c.cycle_seconds)))
+    )).one()
+    hours = lambda value: round(value / 3600, 2) if value is not None else None
+
+    completed_by_week = dict(db.session.query(flow_status_week.c.week, flow_status_week.c.entered).filter(
+        flow_status_week.c.status == 'integrated', flow_status_week.c.week >= since))
+    throughput = [{'week': week.isoformat(), 'completed': completed_by_week.get(week, 0)}
+                  for week in (since + timedelta(weeks=index) for index in range(weeks))]
+
+    wip = {}
+    for assignee_id, username, status, count in db.session.query(
+            Task.assignee_id, User.username, Task.status, db.func.count(Task.id)
+    ).outerjoin(User, User.id == Task.assignee_id).filter(Task.status.in_(WIP_STATUSES)).group_by(
+            Task.assignee_id, User.username, Task.status):
+        entry = wip.setdefault(assignee_id, {'assignee_id': assignee_id, 'assignee': username, 'total': 0,
+                                             'by_status': {status: 0 for status in WIP_STATUSES}})
+        entry['by_status'][status] = count
+        entry['total'] += count
+
+    return {
+        'since': since.isoformat(),
+        'weeks': weeks,
+        'dwell': dwell,
+        'cycle_time': {'completed': completed, 'average_hours': hours(average),
+                       'median_hours': hours(median), 'p85_hours': hours(p85)},
+        'throughput': throughput,
+        'wip': sorted(wip.values(), key=lambda entry: -entry['total'])
+    }
+
+def load_history_page(task_id, before=None, limit=None):
+    """One page of a task's status history, oldest first, and the cursor for the page before it."""
+    limit = limit or app.config['HISTORY_PAGE_SIZE']
+    query = db.session.query(StatusHistory.id, StatusHistory.old_status, StatusHistory.new_status,
+                             User.username, StatusHistory.timestamp).outerjoin(
+        User, User.id == StatusHistory.user_id).filter(StatusHistory.task_id == task_id)
+    if before is not None:
+        query = query.filter(StatusHistory.id < before)
+    rows = query.order_by(StatusHistory.id.desc()).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return [{
+        'old_status': row.old_status,
+        'new_status': row.new_status,
+        'user': row.username,
+        'timestamp': row.timestamp.isoformat()
+    } for row in reversed(rows[:limit])], next_cursor
+
+@app.cli.command('rebuild-flow')
+def rebuild_flow_command():
+    """Rebuild the flow analytics rollups from status_history."""
+    count = rebuild_flow_rollups()
+    db.session.commit()
+    click.echo(f'Folded history for {count} started tasks')
+
+# ==================== SEARCH ====================
+
+SNIPPET_OPEN = '\x02'
+SNIPPET_CLOSE = '\x03'
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+def format_snippet(text):
+    """Escape a snippet and turn the match markers into <mark> tags."""
+    return html.escape(text).replace(SNIPPET_OPEN, '<mark>').replace(SNIPPET_CLOSE, '</mark>')
+
+def encode_search_cursor(rank, task_id):
+    return f'{rank!r}:{task_id}'
+
+def decode_search_cursor(cursor):
+    """Parse a cursor from encode_search_cursor; raises ValueError if it is not one."""
+    rank, separator, task_id = cursor.rpartition(':')
+    rank = float(rank) if separator else math.nan
+    if not math.isfinite(rank):
+        raise ValueError(f'Invalid search cursor {cursor!r}')
+    return rank, int(task_id)
+
+# Engine -> whether its database has the task_search table, so searches and
+# index writes skip the sqlite_master lookup
+fts_tables = {}
+
+def fts_available():
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    if db.engine not in fts_tables:
+        fts_tables[db.engine] = db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_search'"
+        )).first() is not None
+    return fts_tables[db.engine]
+
+def drop_search_index():
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('DROP TABLE IF EXISTS task_search')
+    fts_tables.pop(db.engine, None)
+
+def ensure_search_index():
+    """Create the FTS5 table if it is missing. Returns False if FTS5 is unavailable.
+
+    The table starts empty; callers fill it with rebuild_search_index and commit.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    if fts_available():
+        return True
+    try:
+        # A savepoint, so a SQLite build without FTS5 keeps the caller's pending work
+        with db.session.begin_nested():
+            db.session.execute(db.text(
+                "CREATE VIRTUAL TABLE task_search USING fts5("
+                "title, description, documentation, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+    except OperationalError:
+        return False
+    fts_tables.pop(db.engine, None)
+    return True
+
+def rebuild_search_index():
+    db.session.execute(db.text('DELETE FROM task_search'))
+    db.session.execute(db.text(
+        'INSERT INTO task_search (rowid, title, description, documentation) '
+        'SELECT task.id, task.title, task.description, documentation.content '
+        'FROM task LEFT OUTER JOIN documentation ON documentation.task_id = task.id'
+    ))
+    record_change('data_rebuilt')
+
+def index_task_text(task_id, title, description, documentation):
+    if not fts_available():
+        return
+    unindex_task_text(task_id)
+    db.session.execute(db.text(
+        'INSERT INTO task_search (rowid, title, description, documentation) '
+        'VALUES (:task_id, :title, :description, :documentation)'
+    ), {'task_id': task_id, 'title': title, 'description': description, 'documentation': documentation})
+
+def index_tasks_text(rows):
+    """Bulk-index (task_id, title, description, documentation) rows."""
+    if rows and fts_available():
+        db.session.execute(db.text('DELETE FROM task_search WHERE rowid = :task_id'),
+                           [{'task_id': row[0]} for row in rows])
+        db.session.execute(db.text(
+            'INSERT INTO task_search (rowid, title, description, documentation) '
+            'VALUES (:task_id, :title, :description, :documentation)'
+        ), [{'task_id': task_id, 'title': title, 'description': description, 'documentation': documentation}
+            for task_id, title, description, documentation in rows])
+
+def unindex_task_text(task_id):
+    if fts_available():
+        db.session.execute(db.text('DELETE FROM task_search WHERE rowid = :task_id'), {'task_id': task_id})
+
+def build_fts_query(tokens):
+    """Quote every token and prefix-match the last one for search-as-you-type."""
+    return ' '.join(f'"{token}"' for token in tokens) + '*'
+
+def search_fts(tokens, limit, after=None):
+    params = {'query': build_fts_query(tokens), 'limit': limit}
+    page_filter = ''
+    if after:
+        page_filter = 'WHERE rank > :after_rank OR (rank = :after_rank AND task_id > :after_id)'
+        params.update(after_rank=after[0], after_id=after[1])
+    rows = db.session.execute(db.text(f'''
+        SELECT * FROM (
+            SELECT task_search.rowid AS task_id, task.title, task.description, task.status,
+                   task_search.documentation,
+                   bm25(task_search, 10.0, 5.0, 1.0) AS rank,
+                   snippet(task_search, -1, :open, :close, '...', 12) AS snippet
+            FROM task_search JOIN task ON task.id = task_search.rowid
+            WHERE task_search MATCH :query
+        ) {page_filter}
+        ORDER BY rank, task_id
+        LIMIT :limit
+    '''), dict(params, open=SNIPPET_OPEN, close=SNIPPET_CLOSE)).all()
+    return [(row.task_id, row.title, row.description, row.status, row.documentation, row.rank, row.snippet)
+            for row in rows]
+
+class InvertedSearchIndex:
+    """In-process BM25 index used when SQLite FTS5 is unavailable.
+
+    It catches up from the change log before each search, so only tasks
+    written since the last search are re-read.
+    """
+    FIELD_WEIGHTS = (10.0, 5.0, 1.0)
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.documents = {}
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+
+    def sync(self):
+        with self.lock:
+            version = get_graph_version()
+            if version == self.version:
+                return
+            oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+            if self.version is None or version < self.version or (oldest and self.version < oldest - 1):
+                for task_id in list(self.documents):
+                    self._remove(task_id)
+                self._load(None)
+            else:
+                changed = {row[0] for row in db.session.query(ChangeLog.task_id).filter(
+                    ChangeLog.id > self.version,
+                    ChangeLog.kind.in_(['task_created', 'task_updated', 'task_deleted']))}
+                for task_id in changed:
+                    self._remove(task_id)
+                if changed:
+                    self._load(changed)
+            self.version = version
+
+    def _load(self, task_ids):
+        rows = db.session.query(Task.id, Task.title, Task.description, Documentation.content).outerjoin(
+            Documentation, Documentation.task_id == Task.id)
+        if task_ids is not None:
+            rows = rows.filter(Task.id.in_(task_ids))
+        for task_id, title, description, documentation in rows:
+            fields = (title or '', description or '', documentation or '')
+            self.documents[task_id] = fields
+            weighted_length = 0.0
+            for weight, text in zip(self.FIELD_WEIGHTS, fields):
+                tokens = tokenize(text)
+                weighted_length += weight * len(tokens)
+                for token in tokens:
+                    self.postings[token][task_id] = self.postings[token].get(task_id, 0) + weight
+            self.lengths[task_id] = weighted_length
+
+    def _remove(self, task_id):
+        fields = self.documents.pop(task_id, None)
+        self.lengths.pop(task_id, None)
+        if fields is None:
+            return
+        for token in set(token for text in fields for token in tokenize(text)):
+            self.postings[token].pop(task_id, None)
+            if not self.postings[token]:
+                del self.postings[token]
+
+    def search(self, tokens):
+        """Return (task_id, rank, snippet) for tasks matching every token, best first."""
+        self.sync()
+        with self.lock:
+            expanded = [[token] for token in tokens[:-1]]
+            expanded.append([term for term in self.postings if term.startswith(tokens[-1])])
+            matches = None
+            for terms in expanded:
+                ids = set()
+                for term in terms:
+                    ids.update(self.postings[term])
+                matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+            total = len(self.documents)
+            average = (sum(self.lengths.values()) / total) or 1.0
+            scores = {}
+            for terms in expanded:
+                for term in terms:
+                    posting = self.postings[term]
+                    idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for task_id in matches & posting.keys():
+                        frequency = posting[task_id]
+                        norm = self.K1 * (1 - self.B + self.B * self.lengths[task_id] / average)
+                        scores[task_id] = scores.get(task_id, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+            return sorted(((task_id, -score, self._snippet(task_id, expanded)) for task_id, score in scores.items()),
+                          key=lambda hit: (hit[1], hit[0]))
+
+    def _snippet(self, task_id, expanded, width=12):
+        terms = {term for terms in expanded for term in terms}
+        for text in self.documents[task_id]:
+            words = list(re.finditer(r'\w+', text))
+            hits = [i for i, word in enumerate(words) if word.group().lower() in terms]
+            if not hits:
+                continue
+            start = max(0, hits[0] - width // 3)
+            window = words[start:start + width]
+            parts = []
+            position = window[0].start()
+            for word in window:
+                parts.append(text[position:word.start()])
+                if word.group().lower() in terms:
+                    parts.append(SNIPPET_OPEN + word.group() + SNIPPET_CLOSE)
+                else:
+                    parts.append(word.group())
+                position = word.end()
+            prefix = '...' if start > 0 else ''
+            suffix = '...' if start + width < len(words) else ''
+            return prefix + ''.join(parts) + suffix
+        return ''
+
+inverted_search_index = InvertedSearchIndex()
+
+def search_inverted(tokens, limit, after=None):
+    hits = inverted_search_index.search(tokens)
+    if after:
+        hits = [hit for hit in hits if (hit[1], hit[0]) > after]
+    hits = hits[:limit]
+    rows = {row[0]: row for row in db.session.query(
+        Task.id, Task.title, Task.description, Task.status, Documentation.content
+    ).outerjoin(Documentation, Documentation.task_id == Task.id).filter(Task.id.in_([hit[0] for hit in hits]))}
+    return [tuple(rows[task_id]) + (rank, snippet) for task_id, rank, snippet in hits if task_id in rows]
+
+def search_tasks(query, limit, cursor=None):
+    """Ranked full-text search over title, description and documentation.
+
+    Returns (results, next_cursor); a malformed cursor raises ValueError.
+    Uses SQLite FTS5 when the task_search table exists, falling back to the
+    in-process inverted index otherwise.
+    """
+    after = decode_search_cursor(cursor) if cursor else None
+    tokens = tokenize(query)
+    if not tokens:
+        return [], None
+    search_backend = search_fts if fts_available() else search_inverted
+    rows = search_backend(tokens, limit + 1, after)
+    results = [{
+        'id': task_id,
+        'title': title,
+        'description': description[:100] if description else '',
+        'doc_preview': documentation[:200] if documentation else '',
+        'status': status,
+        'snippet': format_snippet(snippet),
+        'rank': rank
+    } for task_id, title, description, status, documentation, rank, snippet in rows[:limit]]
+    next_cursor = encode_search_cursor(results[-1]['rank'], results[-1]['id']) if len(rows) > limit else None
+    return results, next_cursor
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the FTS5 search index from tasks and documentation."""
+    if not ensure_search_index():
+        raise click.ClickException('SQLite FTS5 is not available; searches use the in-process index')
+    rebuild_search_index()
+    db.session.commit()
+    click.echo('Search index rebuilt')
+
+@app.cli.command('bench-search')
+@click.option('--queries', default=50, help='Number of sample queries drawn from task titles.')
+@click.option('--repeat', default=5, help='Times each query is run per backend.')
+def bench_search_command(queries, repeat):
+    """Compare ILIKE, FTS5 and the inverted index on the current database."""
+    titles = [row[0] for row in db.session.query(Task.title).limit(queries * 4)]
+    words = [word for title in titles for word in tokenize(title) if len(word) > 2]
+    samples = random.Random(0).sample(words, min(queries, len(words)))
+    if not samples:
+        raise click.ClickException('No tasks to sample queries from')
+
+    def legacy(query):
+        tasks = Task.query.filter(or_(Task.title.ilike(f'%{query}%'), Task.description.ilike(f'%{query}%'))).all()
+        return [task.documentation.content[:200] if task.documentation else '' for task in tasks]
+
+    backends = [('ilike', legacy)]
+    if fts_available():
+        backends.append(('fts5', lambda query: search_fts(tokenize(query), 20)))
+    inverted_search_index.sync()
+    backends.append(('inverted', lambda query: search_inverted(tokenize(query), 20)))
+    for name, run in backends:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query in samples:
+                run(query[:-1])
+        elapsed = (time.perf_counter() - started) / (repeat * len(samples))
+        click.echo(f'{name:>9}: {elapsed * 1000:.3f} ms/query over {len(samples)} queries x {repeat}')
+
+# ==================== EVENTS ====================
+
+def serialize_change(entry):
+    return {
+        'id': entry.id,
+        'kind': entry.kind,
+        'task_id': entry.task_id,
+        'parent_id': entry.parent_id,
+        'child_id': entry.child_id
+    }
+
+class LocalEventBroker:
+    """Fans committed change log entries out to every open event stream in this process.
+
+    Subscribers share one condition variable and a bounded backlog instead of
+    per-client queues. An open stream still holds a server thread, parked on
+    the condition while idle, so at most EVENT_MAX_STREAMS are open at once
+    and each is closed after EVENT_STREAM_MAX_SECONDS. The default is well
+    above a team's open boards; polling the delta API is only the overflow path.
+    """
+
+    def __init__(self, backlog=1000):
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=backlog)
+        self.evicted_id = 0
+        self.streams = 0
+        self.rejected_streams = 0
+
+    def open_stream(self):
+        """Reserve a stream slot. Returns False if every slot is taken."""
+        with self.condition:
+            if self.streams >= app.config['EVENT_MAX_STREAMS']:
+                self.rejected_streams += 1
+                return False
+            self.streams += 1
+            return True
+
+    def close_stream(self):
+        with self.condition:
+            self.streams -= 1
+
+    def publish(self, events):
+        with self.condition:
+            for event in events:
+                if len(self.events) == self.events.maxlen:
+                    self.evicted_id = self.events[0]['id']
+                self.events.append(event)
+            self.condition.notify_all()
+
+    def latest_id(self):
+        with self.condition:
+            return self.events[-1]['id'] if self.events else 0
+
+    def wait(self, last_id, timeout):
+        """Block until there are events after last_id. Returns (events, missed)."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.events and self.events[-1]['id'] > last_id, timeout)
+            if last_id < self.evicted_id:
+                return [], True
+            return [event for event in self.events if event['id'] > last_id], False
+
+class ChangeLogEventBroker(LocalEventBroker):
+    """Broker for multi-worker deployments: one thread per process polls the shared change log.
+
+    Commits made by any worker become visible to every worker's streams within
+    poll_interval seconds; local publishes are ignored in favour of the poll.
+    """
+
+    def __init__(self, backlog=1000, poll_interval=1.0):
+        super().__init__(backlog)
+        self.poll_interval = poll_interval
+        self.poller = None
+        self.last_polled_id = None
+
+    def publish(self, events):
+        pass
+
+    def wait(self, last_id, timeout):
+        self.start()
+        return super().wait(last_id, timeout)
+
+    def start(self):
+        with self.condition:
+            if self.poller is None:
+                self.poller = threading.Thread(target=self.poll, daemon=True)
+                self.poller.start()
+
+    def poll(self):
+        while True:
+            with app.app_context():
+                if self.last_polled_id is None:
+                    self.last_polled_id = get_graph_version()
+                entries = ChangeLog.query.filter(ChangeLog.id > self.last_polled_id).order_by(ChangeLog.id).all()
+                if entries:
+                    self.last_polled_id = entries[-1].id
+                    super().publish([serialize_change(entry) for entry in entries])
+            time.sleep(self.poll_interval)
+
+EVENT_BROKERS = {'local': LocalEventBroker, 'changelog': ChangeLogEventBroker}
+if app.config['EVENT_BROKER'] not in EVENT_BROKERS:
+    raise ValueError(f'EVENT_BROKER must be one of {", ".join(EVENT_BROKERS)}')
+event_broker = EVENT_BROKERS[app.config['EVENT_BROKER']]()
+
+@event.listens_for(Session, 'after_flush')
+def collect_change_events(session, flush_context):
+    entries = [obj for obj in session.new if isinstance(obj, ChangeLog)]
+    if entries:
+        session.info.setdefault('pending_events', []).extend(serialize_change(entry) for entry in entries)
+
+@event.listens_for(Session, 'after_commit')
+def publish_change_events(session):
+    events = session.info.pop('pending_events', None)
+    if events:
+        event_broker.publish(events)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_change_events(session):
+    session.info.pop('pending_events', None)
+
+def format_sse(event_id, kind, data):
+    return f'id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n'
+
+def stream_events(last_id, replay, missed):
+    """SSE body; ends after EVENT_STREAM_MAX_SECONDS so the client reconnects and the slot turns over."""
+    deadline = time.monotonic() + app.config['EVENT_STREAM_MAX_SECONDS']
+    yield f'retry: {app.config["EVENT_RETRY_MS"]}\n\n'
+    if missed:
+        yield format_sse(last_id, 'resync', {})
+    for event in replay:
+        last_id = event['id']
+        yield format_sse(event['id'], event['kind'], event)
+    while time.monotonic() < deadline:
+        timeout = min(app.config['EVENT_HEARTBEAT_SECONDS'], max(deadline - time.monotonic(), 0))
+        events, missed = event_broker.wait(last_id, timeout)
+        if missed:
+            last_id = event_broker.latest_id()
+            yield format_sse(last_id, 'resync', {})
+        elif not events:
+            yield ': heartbeat\n\n'
+        for event in events:
+            last_id = event['id']
+            yield format_sse(event['id'], event['kind'], event)
+
+# ==================== BATCH ====================
+
+def apply_batch(operations, user):
+    """Validate and apply a list of graph operations in one transaction.
+
+    Operations are dicts with an 'op' of create_task, add_edge, remove_edge or
+    set_status. Tasks created in the batch get a client-chosen 'ref' string
+    that later operations may use in place of a task id. set_status follows the
+    task editor's rules, including its 'override_warning' flag. Nothing is
+    written unless every operation is valid. Returns (ref_ids, errors).
+    """
+    errors = []
+    refs = {}
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in (
+                'create_task', 'add_edge', 'remove_edge', 'set_status'):
+            errors.append({'index': index, 'message': 'Unknown operation'})
+        elif operation['op'] == 'create_task':
+            ref = operation.get('ref')
+            if not isinstance(ref, str) or not ref:
+                errors.append({'index': index, 'message': 'create_task needs a string ref'})
+            elif ref in refs:
+                errors.append({'index': index, 'message': f'Duplicate ref {ref}'})
+            elif not operation.get('title'):
+                errors.append({'index': index, 'message': 'Title required'})
+            elif not isinstance(operation.get('parent_ids', []), list) or not all(
+                    isinstance(parent, (int, str)) and not isinstance(parent, bool)
+                    for parent in operation.get('parent_ids', [])):
+                errors.append({'index': index, 'message': 'parent_ids must be a list of task ids or refs'})
+            else:
+                refs[ref] = index
+    if errors:
+        return {}, errors
+
+    referenced = set()
+    status_ids = set()
+    for operation in operations:
+        values = [operation.get('task_id'), operation.get('parent_id'), operation.get('child_id')]
+        if operation['op'] == 'create_task':
+            values.extend(operation.get('parent_ids', []))
+        values = {value for value in values if isinstance(value, int) and not isinstance(value, bool)}
+        referenced |= values
+        if operation['op'] == 'set_status':
+            status_ids |= values
+    tasks = {t.id: t for t in Task.query.filter(Task.id.in_(referenced))}
+    # Any path between two referenced tasks runs through tasks that are below one
+    # and above another, so that slice of the graph is all a new cycle can use
+    below = {d for d, in db.session.query(task_closure.c.descendant_id).filter(task_closure.c.ancestor_id.in_(tasks))}
+    above = {a for a, in db.session.query(task_closure.c.ancestor_id).filter(task_closure.c.descendant_id.in_(tasks))}
+    between = set(tasks) | (below & above)
+    nodes = between | {('ref', ref) for ref in refs}
+    # Status checks also need every direct child of the tasks being moved
+    children_of = defaultdict(set)
+    for p, c in db.session.query(task_parents.c.parent_id, task_parents.c.child_id).filter(
+            task_parents.c.parent_id.in_(between)):
+        if c in between or p in status_ids:
+            children_of[p].add(c)
+    child_ids = {c for p in status_ids for c in children_of[p]} - set(tasks)
+    known = {t.id: (t.title, t.status, t.version) for t in tasks.values()}
+    known.update((task_id, (title, status, version)) for task_id, title, status, version in db.session.query(
+        Task.id, Task.title, Task.status, Task.version).filter(Task.id.in_(child_ids)))
+    statuses = {task_id: status for task_id, (_, status, _) in known.items()}
+    statuses.update((('ref', ref), 'not_started') for ref in refs)
+    title_of = lambda node: operations[refs[node[1]]]['title'] if isinstance(node, tuple) else known[node][0]
+
+    def resolve(value):
+        if isinstance(value, str) and value in refs:
+            return ('ref', value)
+        if isinstance(value, int) and not isinstance(value, bool) and value in tasks:
+            return value
+        return None
+
+    added = []
+    removed = []
+    status_changes = []
+    for index, operation in enumerate(operations):
+        op = operation['op']
+        if op == 'create_task':
+            pairs = [(parent, operation['ref']) for parent in operation.get('parent_ids', [])]
+        elif op in ('add_edge', 'remove_edge'):
+            pairs = [(operation.get('parent_id'), operation.get('child_id'))]
+        else:
+            task = resolve(operation.get('task_id'))
+            if task is None:
+                errors.append({'index': index, 'message': 'Task not found'})
+            elif operation.get('status') not in STATUS_ORDER:
+                errors.append({'index': index, 'message': 'Unknown status'})
+            elif isinstance(task, int) and not tasks[task].can_edit(user):
+                errors.append({'index': index, 'message': 'Permission denied'})
+            else:
+                statuses[task] = operation['status']
+                status_changes.append((index, task, operation['status'], bool(operation.get('override_warning'))))
+            continue
+        for parent_value, child_value in pairs:
+            parent, child = resolve(parent_value), resolve(child_value)
+            if parent is None or child is None:
+                errors.append({'index': index, 'message': 'Task not found'})
+            elif parent == child:
+                errors.append({'index': index, 'message': 'Task cannot be its own parent'})
+            elif op == 'remove_edge':
+                if child not in children_of[parent]:
+                    errors.append({'index': index, 'message': 'Task is not a parent'})
+                else:
+                    children_of[parent].discard(child)
+                    removed.append((parent, child))
+            elif child in children_of[parent]:
+                errors.append({'index': index, 'message': 'Task is already a child'})
+            else:
+                children_of[parent].add(child)
+                added.append((index, parent, child))
+
+    # One topological pass over the resulting graph; whatever cannot be ordered lies on a cycle
+    pending = defaultdict(int)
+    for node in nodes:
+        for c in children_of[node] & nodes:
+            pending[c] += 1
+    ready = [node for node in nodes if pending[node] == 0]
+    ordered = set()
+    while ready:
+        node = ready.pop()
+        ordered.add(node)
+        for c in children_of[node] & nodes:
+            pending[c] -= 1
+            if pending[c] == 0:
+                ready.append(c)
+    if len(ordered) < len(nodes):
+        cyclic = nodes - ordered
+        flagged = {index for index, parent, child in added if parent in cyclic and child in cyclic}
+        errors.extend({'index': index, 'message': 'Circular relationship detected'} for index in sorted(flagged))
+        if not flagged:
+            errors.append({'index': None, 'message': 'Task graph already has a cycle'})
+    # Same rules as update_task, against the children and statuses the batch leaves behind.
+    # Children the batch moves itself are version-checked by their own update.
+    moving = {task for _, task, status, _ in status_changes if isinstance(task, int) and status != tasks[task].status}
+    checked_versions = {}
+    for index, task, status, override in status_changes:
+        if status == (tasks[task].status if isinstance(task, int) else 'not_started'):
+            continue
+        checked_versions.update((c, known[c][2]) for c in children_of[task] if isinstance(c, int) and c not in moving)
+        problem = check_status_change(status, [(title_of(c), statuses[c]) for c in children_of[task]], override)
+        if problem:
+            message, warning = problem
+            errors.append({'index': index, 'message': message, 'warning': True} if warning
+                          else {'index': index, 'message': message})
+    if errors:
+        return {}, sorted(errors, key=lambda error: -1 if error['index'] is None else error['index'])
+
+    new_tasks = {ref: Task(title=operations[index]['title'],
+                           description=operations[index].get('description', ''),
+                           creator_id=user.id, status='not_started')
+                 for ref, index in refs.items()}
+    db.session.add_all(new_tasks.values())
+    db.session.flush()
+    ids = {('ref', ref): task.id for ref, task in new_tasks.items()}
+    task_id = lambda node: ids.get(node, node)
+    db.session.add_all(Documentation(task_id=task.id, content='') for task in new_tasks.values())
+
+    changes = [ChangeLog(kind='task_created', task_id=task.id) for task in new_tasks.values()]
+    history = []
+    for index, node, status, override in status_changes:
+        task = new_tasks[node[1]] if isinstance(node, tuple) else tasks[node]
+        if task.status != status:
+            if override:
+                task.override_warning = True
+            history.append(StatusHistory(task_id=task.id, old_status=task.status, new_status=status,
+                                         user_id=user.id, timestamp=datetime.utcnow()))
+            changes.append(ChangeLog(kind='task_status', task_id=task.id))
+            task.status = status
+    record_flow_transitions([(h.task_id, h.old_status, h.new_status, h.timestamp) for h in history])
+    db.session.add_all(history)
+
+    removed = [(task_id(p), task_id(c)) for p, c in removed]
+    added = [(task_id(p), task_id(c)) for _, p, c in added]
+    changes.extend(ChangeLog(kind='edge_removed', parent_id=p, child_id=c) for p, c in removed)
+    changes.extend(ChangeLog(kind='edge_added', parent_id=p, child_id=c) for p, c in added)
+    full_rebuild = len(added) + len(removed) > app.config['BATCH_INCREMENTAL_LIMIT']
+    for p, c in removed:
+        db.session.execute(task_parents.delete().where(
+            task_parents.c.parent_id == p, task_parents.c.child_id == c))
+        if not full_rebuild:
+            index_edge_removed(p, c)
+    if added:
+        db.session.execute(task_parents.insert(), [{'parent_id': p, 'child_id': c} for p, c in added])
+    if full_rebuild:
+        # Cycle checks need the closure now; rollups can follow in the background
+        rebuild_closure()
+        enqueue_job('recompute_rollups')
+    else:
+        for p, c in added:
+            index_edge_added(p, c)
+        moved = {task_id(node) for _, node, _, _ in status_changes}
+        touched = {p for p, _ in removed + added} | moved
+        touched.update(p for p, in db.session.query(task_parents.c.parent_id).filter(task_parents.c.child_id.in_(moved)))
+        refresh_rollups(touched | {task.id for task in new_tasks.values()})
+        for c in {c for _, c in removed + added}:
+            refresh_depths(c, defer_over=app.config['DEPTH_REFRESH_INLINE_LIMIT'])
+    record_changes(changes)
+    index_tasks_text([(task.id, task.title, task.description, '') for task in new_tasks.values()])
+    verify_versions(checked_versions)
+    db.session.commit()
+    return {ref: task.id for ref, task in new_tasks.items()}, []
+
+def load_plan(path):
+    """Read a plan file into batch operations.
+
+    JSON files hold either a list of operations or {"operations": [...]}.
+    CSV files have ref, title, description, parents and status columns, where
+    parents is a ';'-separated list of refs or existing task ids.
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+            return data['operations'] if isinstance(data, dict) else data
+        operations = []
+        statuses = []
+        for row in csv.DictReader(f):
+            parents = [value.strip() for value in (row.get('parents') or '').split(';') if value.strip()]
+            operations.append({
+                'op': 'create_task',
+                'ref': row['ref'],
+                'title': row['title'],
+                'description': row.get('description') or '',
+                'parent_ids': [int(value) if value.isdigit() else value for value in parents]
+            })
+            if row.get('status') and row['status'] != 'not_started':
+                statuses.append({'op': 'set_status', 'task_id': row['ref'], 'status': row['status']})
+        return operations + statuses
+
+@app.cli.command('import-plan')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', default='admin', help='Username recorded as the creator.')
+@click.option('--override-warnings', is_flag=True, help='Set statuses even where children are unfinished.')
+def import_plan_command(path, username, override_warnings):
+    """Import a JSON or CSV project plan in a single transaction."""
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f'User {username} not found')
+    started = time.perf_counter()
+    operations = load_plan(path)
+    if override_warnings:
+        for operation in operations:
+            if isinstance(operation, dict) and operation.get('op') == 'set_status':
+                operation['override_warning'] = True
+    ref_ids, errors = apply_batch(operations, user)
+    for error in errors:
+        click.echo(f'operation {error["index"]}: {error["message"]}', err=True)
+    if errors:
+        raise click.ClickException(f'{len(errors)} operations failed validation; nothing was imported')
+    click.echo(f'Imported {len(ref_ids)} tasks in {time.perf_counter() - started:.2f}s')
+
+# ==================== EXPORT ====================
+
+EXPORT_FORMAT = 'projtree-ndjson'
+EXPORT_BATCH_SIZE = 1000
+DERIVED_TASK_COLUMNS = ('depth', 'child_count', 'importance_weight', 'progress', 'unfinished_children')
+# Only the CLI backup carries these; downloads over HTTP leave them out
+SECRET_USER_COLUMNS = ('password_hash',)
+# Stands in for a password hash missing from the export; matches no password
+UNUSABLE_PASSWORD_HASH = '!'
+
+def export_tables(include_secrets=True):
+    """(record type, table, columns) in dependency order, so a restore never references rows it has not seen."""
+    return [
+        ('user', User.__table__, [c for c in User.__table__.columns
+                                  if include_secrets or c.name not in SECRET_USER_COLUMNS]),
+        ('task', Task.__table__, [c for c in Task.__table__.columns if c.name not in DERIVED_TASK_COLUMNS]),
+        ('edge', task_parents, list(task_parents.columns)),
+        ('documentation', Documentation.__table__, list(Documentation.__table__.columns)),
+        ('history', StatusHistory.__table__, list(StatusHistory.__table__.columns))
+    ]
+
+def iter_export_lines(include_secrets=True):
+    yield json.dumps({'type': 'header', 'format': EXPORT_FORMAT, 'version': 1,
+                      'exported_at': datetime.utcnow().isoformat(), 'password_hashes': include_secrets}) + '\n'
+    for kind, table, columns in export_tables(include_secrets):
+        rows = db.session.execute(db.select(*columns).order_by(*table.primary_key.columns).execution_options(
+            yield_per=EXPORT_BATCH_SIZE))
+        for row in rows:
+            record = {'type': kind}
+            for column, value in zip(columns, row):
+                record[column.name] = value.isoformat() if isinstance(value, datetime) else value
+            yield json.dumps(record) + '\n'
+
+def iter_export_chunks(compress=False, chunk_size=64 * 1024, lines=None):
+    """Group export lines into chunks, gzip-compressing on the fly if asked."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    size = 0
+    for line in lines if lines is not None else iter_export_lines():
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            data = ''.join(buffer).encode()
+            buffer = []
+            size = 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(buffer).encode()
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+def import_records(lines):
+    """Insert exported records in batches, preserving ids. Returns counts per record type.
+
+    Users exported without their password hash get an unusable one and are
+    counted under 'user without password'.
+    """
+    tables = {kind: (table, {c.name: c for c in columns}) for kind, table, columns in export_tables()}
+    counts = defaultdict(int)
+    pending_kind = None
+    pending = []
+
+    def flush():
+        if pending:
+            db.session.execute(tables[pending_kind][0].insert(), pending)
+            counts[pending_kind] += len(pending)
+            pending.clear()
+
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        kind = record.pop('type', None)
+        if kind == 'header':
+            if record.get('format') != EXPORT_FORMAT:
+                raise ValueError(f'Not a {EXPORT_FORMAT} export')
+            continue
+        if kind not in tables:
+            raise ValueError(f'Unknown record type {kind!r}')
+        if kind == 'user' and 'password_hash' not in record:
+            record['password_hash'] = UNUSABLE_PASSWORD_HASH
+            counts['user without password'] += 1
+        columns = tables[kind][1]
+        for name, value in record.items():
+            if name not in columns:
+                raise ValueError(f'Unknown {kind} field {name!r}')
+            if value is not None and isinstance(columns[name].type, db.DateTime):
+                record[name] = datetime.fromisoformat(value)
+        if kind != pending_kind or len(pending) >= EXPORT_BATCH_SIZE:
+            flush()
+            pending_kind = kind
+        pending.append(record)
+    flush()
+    if db.engine.dialect.name == 'postgresql':
+        for table in (User.__table__, Task.__table__, Documentation.__table__, StatusHistory.__table__):
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"))
+    return counts
+
+def open_export(path):
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rt', encoding='utf-8') if compressed else open(path, encoding='utf-8')
+
+@app.cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+def export_command(path, compress):
+    """Stream the whole project (users with password hashes, tasks, edges, docs, history) to an NDJSON file."""
+    with open(path, 'wb') as f:
+        for chunk in iter_export_chunks(compress):
+            f.write(chunk)
+    click.echo(f'Exported to {path}')
+
+@app.cli.command('restore')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def restore_command(path):
+    """Restore an NDJSON export (plain or gzipped) into an empty database."""
+    run_migrations()
+    if User.query.first() or Task.query.first():
+        raise click.ClickException('Restore needs an empty database')
+    with open_export(path) as lines:
+        try:
+            counts = import_records(lines)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    try:
+        rebuild_closure()
+        recompute_rollups()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    rebuild_flow_rollups()
+    db.session.commit()
+    if ensure_search_index():
+        rebuild_search_index()
+        db.session.commit()
+    click.echo(', '.join(f'{count} {kind}' for kind, count in counts.items()) or 'Nothing to restore')
+    if counts.get('user without password'):
+        click.echo('The export had no password hashes: set new passwords for those users before they can log in')
+
+# ==================== SUBGRAPH ====================
+
+def walk_distances(task_id, max_distance, upward):
+    """Recursive CTE over task_parents yielding (task_id, longest, shortest) distance from task_id.
+
+    Walks towards parents when upward, otherwise towards children, never
+    further than max_distance edges.
+    """
+    source, target = (task_parents.c.child_id, task_parents.c.parent_id) if upward else \
+        (task_parents.c.parent_id, task_parents.c.child_id)
+    walk = db.select(db.literal(task_id).label('task_id'), db.literal(0).label('distance')).cte(
+        'walk', recursive=True)
+    walk = walk.union(
+        db.select(target.label('task_id'), (walk.c.distance + 1).label('distance'))
+        .select_from(task_parents.join(walk, source == walk.c.task_id))
+        .where(walk.c.distance < max_distance)
+    )
+    return db.session.execute(db.select(
+        walk.c.task_id, db.func.max(walk.c.distance), db.func.min(walk.c.distance)
+    ).group_by(walk.c.task_id)).all()
+
+def build_subgraph(user, task_id, up, down, limit):
+    """Ancestor/descendant neighbourhood of task_id with a level per node.
+
+    Ancestors get positive levels and descendants negative ones, each the
+    longest path (within the walk bounds) from the focus task, matching the
+    levels the graph view draws. Nodes whose parents or children were cut
+    off by the depth bound or node limit are listed in truncated_up and
+    truncated_down so the client can expand them on demand.
+    """
+    levels = {}
+    closeness = {}
+    for walked_id, longest, shortest in walk_distances(task_id, up, True):
+        levels[walked_id] = longest
+        closeness[walked_id] = shortest
+    for walked_id, longest, shortest in walk_distances(task_id, down, False):
+        if walked_id != task_id:
+            levels[walked_id] = -longest
+            closeness[walked_id] = shortest
+    included = set(sorted(levels, key=lambda t: (closeness[t], t))[:limit])
+    edges = db.session.query(task_parents.c.parent_id, task_parents.c.child_id).filter(or_(
+        task_parents.c.parent_id.in_(included), task_parents.c.child_id.in_(included))).all()
+    truncated_up = sorted({c for p, c in edges if c in included and levels[c] >= 0 and p not in included})
+    truncated_down = sorted({p for p, c in edges if p in included and levels[p] <= 0 and c not in included})
+    nodes = build_task_snapshot(user, included)
+    for node in nodes:
+        node['level'] = levels[node['id']]
+    return {
+        'task_id': task_id,
+        'nodes': nodes,
+        'edges': [[p, c] for p, c in edges if p in included and c in included],
+        'truncated_up': truncated_up,
+        'truncated_down': truncated_down,
+        'limited': len(levels) > limit
+    }
+
+# ==================== LAYOUT ====================
+
+LAYOUT_NODE_SPACING = 140
+LAYOUT_LAYER_SPACING = 160
+LAYOUT_STRUCTURAL_CHANGES = ('task_created', 'task_deleted', 'edge_added', 'edge_removed') + FULL_REFRESH_CHANGES
+
+def compute_layout(layers, edges, previous_x=None, sweeps=4, dirty_layers=None):
+    """Layered (Sugiyama-style) layout of a DAG.
+
+    layers maps node id to its layer (parents above children, as given by
+    Task.depth) and edges are (parent, child) pairs. Edges spanning several
+    layers are routed through dummy nodes. Each layer is ordered by barycenter
+    sweeps to reduce crossings, then nodes are pulled towards the mean x of
+    their neighbours without breaking that order. previous_x, when given,
+    seeds the ordering so unchanged parts of the graph keep their place;
+    dirty_layers then limits the sweeps and alignment to those layers, the
+    rest keep their previous x as is. Dummy nodes are ('dummy', parent, child, layer), so
+    they can be seeded too.
+
+    Returns ({id: (x, y)}, [(parent, child, [(x, y), ...])]).
+    """
+    layers = dict(layers)
+    above = defaultdict(list)
+    below = defaultdict(list)
+    chains = []
+    for parent, child in edges:
+        chain = [parent]
+        for layer in range(layers[parent] + 1, layers[child]):
+            dummy = ('dummy', parent, child, layer)
+            layers[dummy] = layer
+            chain.append(dummy)
+        chain.append(child)
+        for upper, lower in zip(chain, chain[1:]):
+            below[upper].append(lower)
+            above[lower].append(upper)
+        chains.append((parent, child, chain))
+
+    rows = defaultdict(list)
+    for node, layer in layers.items():
+        rows[layer].append(node)
+    depth = max(rows) + 1 if rows else 0
+    previous_x = previous_x or {}
+    position = {}
+
+    def reorder(layer, neighbours):
+        row = rows[layer]
+        keys = {}
+        for node in row:
+            linked = neighbours[node]
+            keys[node] = sum(position[n] for n in linked) / len(linked) if linked else position[node]
+        row.sort(key=lambda node: keys[node])
+        for index, node in enumerate(row):
+            position[node] = index
+
+    for layer in range(depth):
+        row = rows[layer]
+        if previous_x:
+            row.sort(key=lambda node: (previous_x.get(node, float('inf')), str(node)))
+        else:
+            row.sort(key=str)
+        for index, node in enumerate(row):
+            position[node] = index
+    swept = range(depth) if dirty_layers is None else sorted(layer for layer in dirty_layers if layer < depth)
+    for _ in range(sweeps):
+        for layer in swept:
+            if layer > 0:
+                reorder(layer, above)
+        for layer in reversed(swept):
+            if layer < depth - 1:
+                reorder(layer, below)
+
+    if dirty_layers is None:
+        x = {node: index * LAYOUT_NODE_SPACING for node, index in position.items()}
+    else:
+        x = {node: previous_x.get(node, index * LAYOUT_NODE_SPACING) for node, index in position.items()}
+
+    def align(layer, neighbours):
+        row = rows[layer]
+        desired = [sum(x[n] for n in neighbours[node]) / len(neighbours[node]) if neighbours[node] else x[node]
+                   for node in row]
+        left = []
+        for target in desired:
+            left.append(target if not left else max(target, left[-1] + LAYOUT_NODE_SPACING))
+        right = []
+        for target in reversed(desired):
+            right.append(target if not right else min(target, right[-1] - LAYOUT_NODE_SPACING))
+        right.reverse()
+        for node, a, b in zip(row, left, right):
+            x[node] = (a + b) / 2
+
+    for _ in range(2):
+        for layer in swept:
+            if layer > 0:
+                align(layer, above)
+        for layer in reversed(swept):
+            if layer < depth - 1:
+                align(layer, below)
+
+    offset = min(x.values(), default=0)
+    coordinates = {node: (x[node] - offset, layers[node] * LAYOUT_LAYER_SPACING) for node in x}
+    positions = {node: point for node, point in coordinates.items() if not isinstance(node, tuple)}
+    routes = [(parent, child, [coordinates[node] for node in chain]) for parent, child, chain in chains]
+    return positions, routes
+
+class LayoutCache:
+    """Keeps the tree view layout for the current graph version.
+
+    Changes that do not touch nodes or edges only bump the cached version.
+    Structural ones diff the new graph against the one last laid out and
+    re-sweep only the layers whose nodes or edges changed, starting from the
+    previous x positions, so the picture stays stable across local edits.
+    The graph is read and laid out outside the lock; the lock only guards
+    swapping in the result.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.layout = None
+        # (layers, edge set, x of every node and dummy) of the last layout
+        self.graph = None
+
+    def get(self):
+        version = get_graph_version()
+        with self.lock:
+            if version == self.version:
+                return self.layout
+            cached_version, cached_layout, graph = self.version, self.layout, self.graph
+        if cached_version is not None and not has_changes_since(cached_version, LAYOUT_STRUCTURAL_CHANGES):
+            return self.store(version, dict(cached_layout, version=version), graph)
+        layers = {task_id: depth or 0 for task_id, depth in db.session.query(Task.id, Task.depth)}
+        edges = [(p, c) for p, c in db.session.query(task_parents.c.parent_id, task_parents.c.child_id)
+                 if p in layers and c in layers and layers[p] < layers[c]]
+        if graph is None:
+            positions, routes = compute_layout(layers, edges)
+        else:
+            previous_layers, previous_edges, previous_x = graph
+            dirty = changed_layers(previous_layers, previous_edges, layers, set(edges))
+            depth = max(layers.values(), default=-1) + 1
+            positions, routes = compute_layout(layers, edges, previous_x, sweeps=2,
+                                               dirty_layers=dirty if len(dirty) * 2 <= depth else None)
+        layout = {
+            'version': version,
+            'nodes': [{'id': node, 'x': x, 'y': y, 'layer': layers[node]}
+                      for node, (x, y) in sorted(positions.items())],
+            'edges': [{'source': parent, 'target': child, 'points': points}
+                      for parent, child, points in routes],
+            'width': max((x for x, _ in positions.values()), default=0),
+            'height': max((y for _, y in positions.values()), default=0)
+        }
+        return self.store(version, layout, (layers, set(edges), layout_x(layers, positions, routes)))
+
+    def store(self, version, layout, graph):
+        """Swap in a layout unless another thread already stored a newer one."""
+        with self.lock:
+            if self.version is None or version > self.version:
+                self.version, self.layout, self.graph = version, layout, graph
+        return layout
+
+def layout_x(layers, positions, routes):
+    """x of every node and dummy in a compute_layout result, to seed the next one."""
+    x = {node: point[0] for node, point in positions.items()}
+    for parent, child, points in routes:
+        for offset, (point_x, _) in enumerate(points[1:-1], 1):
+            x[('dummy', parent, child, layers[parent] + offset)] = point_x
+    return x
+
+def changed_layers(previous_layers, previous_edges, layers, edges):
+    """Layers that gained, lost or moved a node or an edge, plus their neighbours."""
+    changed = set()
+    for node in previous_layers.keys() | layers.keys():
+        if previous_layers.get(node) != layers.get(node):
+            changed.update(layer for layer in (previous_layers.get(node), layers.get(node)) if layer is not None)
+    for edge_layers, changed_edges in ((previous_layers, previous_edges - edges), (layers, edges - previous_edges)):
+        for parent, child in changed_edges:
+            changed.update(range(edge_layers[parent], edge_layers[child] + 1))
+    return {neighbour for layer in changed for neighbour in (layer - 1, layer, layer + 1) if neighbour >= 0}
+
+layout_cache = LayoutCache()
+
+def generate_layered_dag(node_count, seed=0, width=40, max_parents=3, max_children=None):
+    """Random DAG in roughly `width`-wide layers, for layout and load benchmarks."""
+    rng = random.Random(seed)
+    layers = {}
+    edges = []
+    child_counts = defaultdict(int)
+    for node in range(node_count):
+        layer = node // width
+        layers[node] = layer
+        if layer:
+            candidates = range(max(0, (layer - 3) * width), layer * width)
+            for parent in rng.sample(candidates, min(len(candidates), rng.randint(1, max_parents))):
+                if max_children is None or child_counts[parent] < max_children:
+                    child_counts[parent] += 1
+                    edges.append((parent, node))
+    # Longest-path layering, as Task.depth would give
+    for node in range(node_count):
+        layers[node] = 0
+    for parent, child in sorted(edges, key=lambda edge: edge[1]):
+        layers[child] = max(layers[child], layers[parent] + 1)
+    return layers, edges
+
+@app.cli.command('bench-layout')
+@click.option('--sizes', default='1000,10000,50000', help='Comma-separated node counts.')
+def bench_layout_command(sizes):
+    """Time the layered layout on synthetic graphs, cold and after adding one edge."""
+    for size in (int(value) for value in sizes.split(',')):
+        layers, edges = generate_layered_dag(size)
+        started = time.perf_counter()
+        positions, routes = compute_layout(layers, edges)
+        cold = time.perf_counter() - started
+        previous_x = layout_x(layers, positions, routes)
+        parent = size // 2
+        child = next(node for node in range(parent, size) if layers[node] == layers[parent] + 1)
+        new_edges = edges + [(parent, child)]
+        started = time.perf_counter()
+        compute_layout(layers, new_edges, previous_x, sweeps=2,
+                       dirty_layers=changed_layers(layers, set(edges), layers, set(new_edges)))
+        warm = time.perf_counter() - started
+        click.echo(f'{size:>7} nodes, {len(edges):>7} edges: cold {cold:.2f}s, one edge added {warm:.2f}s')
+
+# ==================== PLANNING ====================
+
+CRITICAL_PATH_CHANGES = ('task_created', 'task_deleted', 'task_status', 'edge_added', 'edge_removed') + FULL_REFRESH_CHANGES
+
+def compute_critical_paths(statuses, edges):
+    """Longest remaining chains through the task DAG, in O(V+E).
+
+    statuses maps task id to status and edges are (parent, child) pairs. A
+    chain is as long as the status steps its tasks still need, so integrated
+    tasks weigh nothing. Returns (paths, roots), where paths holds one map
+    per measure, keyed by task id:
+
+    remaining: the longest chain from the task down through its descendants,
+        i.e. the work left before the task itself can be done;
+    chain: the longest chain from a root down through the task;
+    slack: how much longer that chain could get before it outgrows the
+        longest root the task feeds (0 on a critical path);
+    next: the child the remaining chain continues through, if any.
+
+    and roots lists the tasks without parents, longest first. Raises
+    ValueError if the graph has a cycle.
+    """
+    children_of = defaultdict(list)
+    parents_of = defaultdict(list)
+    for parent, child in edges:
+        children_of[parent].append(child)
+        parents_of[child].append(parent)
+    pending = {t: len(children_of[t]) for t in statuses}
+    # Children before parents
+    order = [t for t, count in pending.items() if count == 0]
+    for t in order:
+        for p in parents_of[t]:
+            pending[p] -= 1
+            if pending[p] == 0:
+                order.append(p)
+    if len(order) < len(statuses):
+        raise ValueError(f'Task graph has a cycle through tasks {sorted(set(statuses) - set(order))}')
+    steps = {t: remaining_steps(status) for t, status in statuses.items()}
+    remaining = {}
+    next_child = {}
+    for t in order:
+        best = max(children_of[t], key=lambda c: (remaining[c], -c), default=None)
+        below = remaining[best] if best is not None else 0
+        remaining[t] = steps[t] + below
+        next_child[t] = best if below else None
+    above = {}
+    longest_root = {}
+    for t in reversed(order):
+        parents = parents_of[t]
+        above[t] = max((above[p] + steps[p] for p in parents), default=0)
+        longest_root[t] = max((longest_root[p] for p in parents), default=remaining[t])
+    chain = {t: above[t] + remaining[t] for t in statuses}
+    paths = {
+        'remaining': remaining,
+        'chain': chain,
+        'slack': {t: longest_root[t] - chain[t] for t in statuses},
+        'next': next_child
+    }
+    roots = sorted((t for t in statuses if not parents_of[t]), key=lambda t: (-remaining[t], t))
+    return paths, roots
+
+class CriticalPathCache:
+    """Keeps the critical-path analysis for the current graph version.
+
+    Only status and structural changes can move a chain, so other changes just
+    bump the cached version.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.paths = compute_critical_paths({}, [])[0]
+        self.roots = []
+
+    def get(self):
+        version = get_graph_version()
+        with self.lock:
+            if version != self.version:
+                if self.version is None or has_changes_since(self.version, CRITICAL_PATH_CHANGES):
+                    statuses = dict(db.session.query(Task.id, Task.status))
+                    edges = [(p, c) for p, c in db.session.query(task_parents.c.parent_id, task_parents.c.child_id)
+                             if p in statuses and c in statuses]
+                    self.paths, self.roots = compute_critical_paths(statuses, edges)
+                self.version = version
+            return version, self.paths, self.roots
+
+critical_path_cache = CriticalPathCache()
+
+def parse_assignee_filter(value):
+    """SQL conditions for an assignee filter such as 'me', 'unassigned', '3' or 'me,unassigned'.
+
+    Raises ValueError on anything else.
+    """
+    conditions = []
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        if part == 'me':
+            conditions.append(Task.assignee_id == current_user.id)
+        elif part == 'unassigned':
+            conditions.append(Task.assignee_id.is_(None))
+        elif part.isdigit():
+            conditions.append(Task.assignee_id == int(part))
+        else:
+            raise ValueError(f'Unknown assignee filter: {part}')
+    return conditions
+
+def build_ready_frontier(conditions, limit):
+    """Unfinished tasks whose children are all at least functional, most critical first.
+
+    The frontier comes straight off the unfinished_children rollup; the
+    critical-path cache only orders it.
+    """
+    version, paths, _ = critical_path_cache.get()
+    query = Task.query.filter(Task.unfinished_children == 0, Task.status != 'integrated')
+    if conditions:
+        query = query.filter(or_(*conditions))
+    tasks = query.all()
+    remaining, chain, slack = paths['remaining'], paths['chain'], paths['slack']
+    tasks.sort(key=lambda t: (slack.get(t.id, 0), -chain.get(t.id, 0), -(t.importance_weight or 0), t.id))
+    shown = tasks[:limit]
+    assignee_ids = {t.assignee_id for t in shown if t.assignee_id}
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(assignee_ids))) if assignee_ids else {}
+    return {
+        'version': version,
+        'total': len(tasks),
+        'tasks': [{
+            'id': t.id,
+            'title': t.title,
+            'status': t.status,
+            'next_status': STATUS_PROGRESSION.get(t.status),
+            'assignee': usernames.get(t.assignee_id),
+            'assignee_id': t.assignee_id,
+            'progress': t.progress,
+            'importance_weight': t.importance_weight,
+            'remaining': remaining.get(t.id, 0),
+            'chain': chain.get(t.id, 0),
+            'slack': slack.get(t.id, 0),
+            'critical': slack.get(t.id, 0) == 0
+        } for t in shown]
+    }
+
+def build_critical_paths(root_id=None, limit=10):
+    """The longest remaining chain under each root (or under root_id), root first."""
+    version, paths, roots = critical_path_cache.get()
+    remaining = paths['remaining']
+    if root_id is not None:
+        roots = [root_id] if root_id in remaining else []
+    roots = roots[:limit]
+    chains = {}
+    for root in roots:
+        chain = []
+        node = root if remaining[root] else None
+        while node is not None:
+            chain.append(node)
+            node = paths['next'][node]
+        chains[root] = chain
+    ids = set(roots) | {node for chain in chains.values() for node in chain}
+    tasks = {t.id: t for t in Task.query.filter(Task.id.in_(ids))} if ids else {}
+    summary = lambda t: {'id': t.id, 'title': t.title, 'status': t.status, 'assignee_id': t.assignee_id,
+                         'remaining': remaining[t.id]}
+    return {
+        'version': version,
+        'roots': [dict(summary(tasks[root]), length=remaining[root],
+                       path=[summary(tasks[node]) for node in chains[root] if node in tasks])
+                  for root in roots if root in tasks]
+    }
+
+@app.cli.command('bench-critical-path')
+@click.option('--sizes', default='1000,10000,50000', help='Comma-separated node counts.')
+def bench_critical_path_command(sizes):
+    """Time the critical-path computation on synthetic graphs (best of three runs)."""
+    rng = random.Random(0)
+    for size in (int(value) for value in sizes.split(',')):
+        _, edges = generate_layered_dag(size)
+        statuses = {node: rng.choice(STATUS_ORDER) for node in range(size)}
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            _, roots = compute_critical_paths(statuses, edges)
+            timings.append(time.perf_counter() - started)
+        elapsed = min(timings)
+        click.echo(f'{size:>7} nodes, {len(edges):>7} edges, {len(roots):>5} roots: {elapsed * 1000:.1f}ms')
+
+# ==================== MIGRATIONS ====================
+
+MIGRATIONS = []
+
+def migration(version, name):
+    """Register a schema migration. Migrations run in version order and must be idempotent."""
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return register
+
+def add_missing_columns(table_name, columns):
+    """Add columns that an older database was created without.
+
+    Migrations spell out the columns they add instead of reading them off the
+    current model, so replaying an old migration adds what it added then.
+    Scalar defaults are rendered by the dialect's literal compiler.
+    """
+    dialect = db.engine.dialect
+    quote = dialect.identifier_preparer.quote
+    existing = {column['name'] for column in db.inspect(db.session.connection()).get_columns(table_name)}
+    added = []
+    for column in columns:
+        if column.name in existing:
+            continue
+        ddl = f'ALTER TABLE {quote(table_name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=dialect)}'
+        if column.default is not None and column.default.is_scalar:
+            default = db.literal(column.default.arg, column.type).compile(
+                dialect=dialect, compile_kwargs={'literal_binds': True})
+            ddl += f' DEFAULT {default}'
+        if not column.nullable:
+            ddl += ' NOT NULL'
+        db.session.execute(db.text(ddl))
+        added.append(column.name)
+    return added
+
+def create_indexes(names):
+    """Create the named model indexes that do not exist yet."""
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name in names:
+                index.create(db.session.connection(), checkfirst=True)
+
+@migration(1, 'create tables')
+def create_tables():
+    db.metadata.create_all(db.session.connection())
+
+@migration(2, 'task rollup columns')
+def add_rollup_columns():
+    # Backfilled by migration 8, which recomputes every rollup once the
+    # columns recompute_rollups writes today all exist
+    add_missing_columns('task', [db.Column(name, db.Integer, default=0)
+                                 for name in ('depth', 'child_count', 'importance_weight', 'progress')])
+
+@migration(3, 'reachability index')
+def backfill_closure():
+    if not db.session.query(task_closure).first() and db.session.query(task_parents).first():
+        rebuild_closure()
+
+@migration(4, 'full-text search index')
+def create_search_index():
+    # Always refill: on SQLite the CREATE itself may already have committed on an earlier, interrupted run
+    if ensure_search_index():
+        rebuild_search_index()
+
+@migration(5, 'hot path indexes')
+def create_hot_path_indexes():
+    create_indexes(('ix_task_parents_child_id_parent_id', 'ix_task_assignee_id', 'ix_task_creator_id',
+                    'ix_task_status', 'ix_task_updated_at', 'ix_documentation_task_id', 'ix_status_history_task_id'))
+
+@migration(6, 'flow analytics rollups')
+def create_flow_rollups():
+    for table in (flow_status_week, flow_cycle):
+        table.create(db.session.connection(), checkfirst=True)
+    if not db.session.query(flow_cycle).first() and db.session.query(StatusHistory.id).first():
+        rebuild_flow_rollups()
+
+@migration(7, 'task row versions')
+def add_task_versions():
+    add_missing_columns('task', [db.Column('version', db.Integer, nullable=False, default=1)])
+
+@migration(8, 'ready frontier')
+def add_ready_frontier():
+    add_missing_columns('task', [db.Column('unfinished_children', db.Integer, default=0)])
+    create_indexes(('ix_task_frontier',))
+    recompute_rollups()
+
+@migration(9, 'background jobs')
+def create_jobs_table():
+    Job.__table__.create(db.session.connection(), checkfirst=True)
+
+def get_schema_version():
+    if not db.inspect(db.session.connection()).has_table(SchemaMigration.__tablename__):
+        return 0
+    return db.session.query(db.func.max(SchemaMigration.version)).scalar() or 0
+
+def run_migrations():
+    """Apply pending migrations, committing after each. Returns the names applied."""
+    current = get_schema_version()
+    applied = []
+    for version, name, func in MIGRATIONS:
+        if version <= current:
+            continue
+        func()
+        SchemaMigration.__table__.create(db.session.connection(), checkfirst=True)
+        db.session.add(SchemaMigration(version=version, name=name))
+        db.session.commit()
+        applied.append(name)
+    return applied
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Bring the database schema up to date."""
+    try:
+        applied = run_migrations()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for name in applied:
+        click.echo(f'Applied: {name}')
+    click.echo(f'Schema is at version {get_schema_version()}')
+
+# ==================== QUERY PLANS ====================
+
+def capture_selects(func):
+    """Run func and return the (statement, parameters) of every SELECT it issued."""
+    statements = []
 
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
 
-# ==================== MODELS ====================
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        func()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return statements
 
-# Association table for many-to-many parent-child relationships
-task_parents = db.Table('task_parents',
-    db.Column('parent_id', db.Integer, db.ForeignKey('task.id'), primary_key=True),
-    db.Column('child_id', db.Integer, db.ForeignKey('task.id'), primary_key=True)
-)
+def find_full_scans(statement, parameters, allowed):
+    """Tables (outside `allowed`) that SQLite would scan in full for a statement."""
+    tables = set(db.metadata.tables) | {'task_search'}
+    scans = []
+    for row in db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters):
+        match = re.match(r'SCAN (\w+)', row[-1])
+        if not match:
+            continue
+        table = re.sub(r'_\d+$', '', match.group(1))
+        # Walking an index in order to the first N rows is a bounded read, not a scan
+        bounded = 'USING' in row[-1] and re.search(r'\bLIMIT\b', statement, re.IGNORECASE)
+        if table in tables and table not in allowed and 'VIRTUAL TABLE' not in row[-1] and not bounded:
+            scans.append(row[-1])
+    return scans
 
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(200), nullable=False)
-    role = db.Column(db.String(20), default='developer')
-    created_tasks = db.relationship('Task', foreign_keys='Task.creator_id', backref='creator')
-    assigned_tasks = db.relationship('Task', foreign_keys='Task.assignee_id', backref='assignee')
+def delta_check_since():
+    """A recent version to ask for a delta from, after any change that forces a full snapshot."""
+    last_full = db.session.query(db.func.max(ChangeLog.id)).filter(ChangeLog.kind.in_(FULL_REFRESH_CHANGES)).scalar()
+    return max(get_graph_version() - 5, last_full or 0)
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+def query_plan_checks(client, task, user):
+    """(name, action, tables allowed to be scanned) for each hot path."""
+    word = (tokenize(task.title) or ['task'])[0]
+    return [
+        ('GET /api/tasks', lambda: client.get('/api/tasks'), {'task', 'task_parents', 'user'}),
+        ('GET /api/tasks?since', lambda: client.get(f'/api/tasks?since={delta_check_since()}'), {'user'}),
+        ('GET /api/task/<id>', lambda: client.get(f'/api/task/{task.id}'), set()),
+        ('GET /api/task/<id>/subgraph', lambda: client.get(f'/api/task/{task.id}/subgraph'), {'user'}),
+        ('GET /api/task/<id>/history', lambda: client.get(f'/api/task/{task.id}/history'), set()),
+        ('GET /api/analytics/flow', lambda: client.get('/api/analytics/flow'), {'user'}),
+        ('GET /api/search', lambda: client.get(f'/api/search?q={word}'), set()),
+        ('GET /api/layout', lambda: client.get('/api/layout'), {'task', 'task_parents'}),
+        ('GET /api/ready', lambda: client.get('/api/ready?assignee=me,unassigned'), {'task', 'task_parents'}),
+        ('GET /api/critical-path', lambda: client.get('/api/critical-path'), {'task', 'task_parents'}),
+        ('GET /dashboard', lambda: client.get('/dashboard'), set()),
+        ('cycle check', lambda: creates_cycle(task.id, task.id + 1), set()),
+        ('parents lookup', lambda: task.parents.all(), set()),
+        ('children lookup', lambda: task.children.all(), set()),
+        ('rollup refresh', lambda: refresh_rollups([task.id]), set()),
+        ('depth refresh', lambda: refresh_depths(task.id), set()),
+        ('status history', lambda: StatusHistory.query.filter_by(task_id=task.id).all(), set()),
+        ('assigned tasks', lambda: Task.query.filter_by(assignee_id=user.id).all(), set())
+    ]
 
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Assert that the hot API paths only use indexed lookups (SQLite only)."""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Query plan checks need SQLite')
+    task = Task.query.join(task_parents, task_parents.c.child_id == Task.id).first()
+    user = User.query.filter_by(role='admin').first()
+    if not task or not user:
+        raise click.ClickException('Needs an admin user and at least one task with a parent')
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    failures = 0
+    for name, action, allowed in query_plan_checks(client, task, user):
+        scans = [scan for statement, parameters in capture_selects(action)
+                 for scan in find_full_scans(statement, parameters, allowed)]
+        db.session.rollback()
+        click.echo(f'{"FAIL" if scans else "ok":>4}  {name}')
+        for scan in sorted(set(scans)):
+            click.echo(f'      {scan}')
+        failures += bool(scans)
+    if failures:
+        raise click.ClickException(f'{failures} paths run full table scans')
 
-class Task(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.Text)
-    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    assignee_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    status = db.Column(db.String(20), default='not_started')
-    override_warning = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    parents = db.relationship('Task',
-        secondary=task_parents,
-        primaryjoin=(task_parents.c.child_id == id),
-        secondaryjoin=(task_parents.c.parent_id == id),
-        backref=db.backref('children', lazy='dynamic'),
-        lazy='dynamic'
-    )
-    
-    documentation = db.relationship('Documentation', backref='task', uselist=False, cascade='all, delete-orphan')
-    status_history = db.relationship('StatusHistory', backref='task', cascade='all, delete-orphan')
+# ==================== STORAGE ====================
 
-    def get_depth(self):
-        if not self.parents.count():
-            return 0
-        max_depth = 0
-        for parent in self.parents:
-            max_depth = max(max_depth, parent.get_depth() + 1)
-        return max_depth
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
 
-    def get_importance_weight(self):
-        depth = self.get_depth()
-        children_count = self.children.count()
-        return depth * 10 + children_count * 2
+def describe_storage():
+    """One-line summary of the database backend and its concurrency settings."""
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            settings = {name: conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+                        for name in app.config['SQLITE_PRAGMAS']}
+        return 'sqlite ' + ', '.join(f'{name}={value}' for name, value in settings.items())
+    return f'{engine.dialect.name} pool_size={engine.pool.size()} overflow={engine.pool._max_overflow}'
 
-    def get_progress(self):
-        children = self.children.all()
-        if not children:
-            return 100 if self.status == 'integrated' else 0
-        total = len(children)
-        completed = sum(1 for child in children if child.status == 'integrated')
-        return int((completed / total) * 100) if total > 0 else 0
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
 
-    def can_edit(self, user):
-        return user.role == 'admin' or user.id == self.creator_id or user.id == self.assignee_id
+def run_load_phase(user_id, task_ids, readers, writers, duration):
+    """Hammer the API from reader and writer threads; returns per-role latencies and error counts."""
+    stop = threading.Event()
+    results = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
 
-    def has_circular_relationship(self, potential_parent_id):
-        if potential_parent_id == self.id:
+    def worker(role):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+        latencies = []
+        failed = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                if role == 'read':
+                    response = client.get('/api/tasks')
+                else:
+                    response = client.put(f'/api/task/{random.choice(task_ids)}',
+                                          json={'description': f'load test {random.random()}'})
+                ok = response.status_code < 400
+            except OperationalError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        with lock:
+            results[role].extend(latencies)
+            errors[role] += failed
+
+    threads = [threading.Thread(target=worker, args=('read',)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=('write',)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+@app.cli.command('load-test')
+@click.option('--readers', default=8, help='Concurrent GET /api/tasks loops.')
+@click.option('--writers', default=4, help='Concurrent PUT /api/task/<id> loops during the write burst.')
+@click.option('--duration', default=5.0, help='Seconds per phase.')
+@click.option('--seed', default=0, help='Create this many tasks first (for an empty database).')
+def load_test_command(readers, writers, duration, seed):
+    """Compare read throughput alone and during a write burst against the configured database."""
+    user = User.query.filter_by(role='admin').first()
+    if not user:
+        raise click.ClickException('Needs an admin user; visit /setup_db or run migrate first')
+    if seed:
+        _, errors = apply_batch([{'op': 'create_task', 'ref': f'load-{index}', 'title': f'Load test task {index}',
+                                  'parent_ids': [f'load-{index // 4}'] if index else []}
+                                 for index in range(seed)], user)
+        if errors:
+            raise click.ClickException(errors[0]['message'])
+    task_ids = [task_id for (task_id,) in db.session.query(Task.id)]
+    user_id = user.id
+    db.session.remove()
+    if not task_ids:
+        raise click.ClickException('No tasks to read; pass --seed')
+    click.echo(describe_storage())
+    click.echo(f'{len(task_ids)} tasks, {readers} readers, {writers} writers, {duration:.0f}s per phase')
+    # Failed requests are counted below; their tracebacks would only bury the summary
+    app.logger.disabled = True
+    try:
+        phases = [('reads only', run_load_phase(user_id, task_ids, readers, 0, duration)),
+                  ('write burst', run_load_phase(user_id, task_ids, readers, writers, duration))]
+    finally:
+        app.logger.disabled = False
+    for name, (results, errors) in phases:
+        reads = results['read']
+        click.echo(f'{name:>12}: {len(reads) / duration:8.1f} reads/s '
+                   f'(p50 {percentile(reads, 0.5) * 1000:.1f}ms, p95 {percentile(reads, 0.95) * 1000:.1f}ms, '
+                   f'{errors["read"]} errors), {len(results["write"]) / duration:.1f} writes/s '
+                   f'({errors["write"]} errors)')
+    baseline = len(phases[0][1][0]['read']) or 1
+    click.echo(f'Read throughput during writes: {len(phases[1][1][0]["read"]) / baseline:.0%} of baseline')
+
+# ==================== HTTP ====================
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify through orjson; the output decodes to the same values as the stdlib provider."""
+
+    options = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+               if orjson else 0)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def response(self, *args, **kwargs):
+        if self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.options) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+JSON_PROVIDERS = {'stdlib': DefaultJSONProvider, 'orjson': OrjsonProvider}
+
+app.json = JSON_PROVIDERS[app.config['JSON_ENCODER']](app)
+
+def graph_etag(version=None):
+    """Strong ETag for a GET whose body depends only on the graph version, the viewer and the URL."""
+    if version is None:
+        version = get_graph_version()
+    url = hashlib.sha1(request.full_path.encode()).hexdigest()[:12]
+    return f'{version}-{current_user.id}-{current_user.role}-{url}'
+
+def conditional_response(etag, build):
+    """304 if the client already holds `etag` (in any content encoding), else build()."""
+    tags = [etag] + [f'{etag}-{encoding}' for encoding in ('br', 'gzip')]
+    if any(request.if_none_match.contains(tag) for tag in tags):
+        response = app.response_class(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = choose_encoding()
+    if encoding is None or len(data) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+    level = app.config['COMPRESS_LEVEL']
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=min(level, 11)))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=level))
+    response.headers['Content-Encoding'] = encoding
+    # A compressed body is a different representation, so it gets its own strong tag
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+def wire_size(response):
+    return len(response.get_data()) + sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+
+@app.cli.command('bench-api')
+@click.option('--requests', 'count', default=50, help='Requests per endpoint and mode.')
+def bench_api_command(count):
+    """Bytes on the wire and server CPU per request for the big read endpoints."""
+    user = User.query.filter_by(role='admin').first()
+    task = Task.query.order_by(Task.id).first()
+    if not user or not task:
+        raise click.ClickException('Needs an admin user and at least one task')
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    default_json = app.json
+    modes = [
+        ('before', JSON_PROVIDERS['stdlib'](app), {}, False),
+        ('encoded', default_json, {'Accept-Encoding': 'br, gzip'}, False),
+        ('revalidated', default_json, {'Accept-Encoding': 'br, gzip'}, True)
+    ]
+    try:
+        for url in ('/api/tasks', f'/api/task/{task.id}', f'/api/task/{task.id}/subgraph'):
+            for name, provider, headers, revalidate in modes:
+                app.json = provider
+                headers = dict(headers)
+                if revalidate:
+                    headers['If-None-Match'] = client.get(url, headers=headers).headers['ETag']
+                started = time.process_time()
+                for _ in range(count):
+                    response = client.get(url, headers=headers)
+                cpu = (time.process_time() - started) / count
+                encoding = response.headers.get('Content-Encoding', 'identity')
+                click.echo(f'{url:<28} {name:<12} {response.status_code} {encoding:<8} '
+                           f'{wire_size(response):>9} bytes {cpu * 1000:8.2f}ms cpu')
+    finally:
+        app.json = default_json
+
+# ==================== METRICS ====================
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class CounterMetric:
+    """Prometheus counter with labels, kept in process memory."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] += amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, labels, (), value) for labels, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, extra, value in self.samples():
+            lines.append(f'{name}{format_labels(self.labelnames, labels, extra)} {value:g}')
+        return '\n'.join(lines)
+
+class HistogramMetric(CounterMetric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, labels, value):
+        with self.lock:
+            counts = self.values.setdefault(labels, [0] * len(self.buckets) + [0, 0.0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for labels, counts in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f'{self.name}_bucket', labels, [('le', f'{bound:g}')], count))
+                samples.append((f'{self.name}_bucket', labels, [('le', '+Inf')], counts[-2]))
+                samples.append((f'{self.name}_count', labels, (), counts[-2]))
+                samples.append((f'{self.name}_sum', labels, (), counts[-1]))
+        return samples
+
+REQUEST_LATENCY = HistogramMetric('projtree_request_duration_seconds', 'Time to build each response.',
+                                  ('method', 'endpoint', 'status'))
+REQUEST_QUERIES = HistogramMetric('projtree_request_queries', 'SQL statements issued per request.',
+                                  ('endpoint',), QUERY_COUNT_BUCKETS)
+SQL_SECONDS = CounterMetric('projtree_sql_seconds_total', 'Time spent executing SQL, by endpoint.', ('endpoint',))
+N_PLUS_ONE = CounterMetric('projtree_n_plus_one_total', 'Requests that repeated one statement shape past the threshold.',
+                           ('endpoint',))
+METRICS = [REQUEST_LATENCY, REQUEST_QUERIES, SQL_SECONDS, N_PLUS_ONE]
+
+# Bind placeholders in every DBAPI paramstyle: pyformat, format, named, numeric and qmark
+STATEMENT_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|(?<![:\w]):\w+|\$\d+|\?')
+
+def statement_shape(statement):
+    """Collapse bind placeholders, expanded IN lists and multi-row VALUES so a query has one shape."""
+    shape = STATEMENT_PLACEHOLDER.sub('?', ' '.join(statement.split()))
+    shape = re.sub(r'\?(?:, \?)+', '?, ...', shape)
+    return re.sub(r'\((\?(?:, \.\.\.)?)\)(?:, \(\1\))+', r'(\1), ...', shape)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'query_count' not in g:
+        return
+    g.query_count += 1
+    g.query_seconds += time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+    if app.config['N_PLUS_ONE_THRESHOLD']:
+        g.query_shapes[statement_shape(statement)] += 1
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.query_count = 0
+    g.query_seconds = 0.0
+    g.query_shapes = defaultdict(int)
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_LATENCY.observe((request.method, endpoint, str(response.status_code)), elapsed)
+    REQUEST_QUERIES.observe((endpoint,), g.query_count)
+    SQL_SECONDS.inc((endpoint,), g.query_seconds)
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    repeated = [(count, shape) for shape, count in g.query_shapes.items() if threshold and count > threshold]
+    if repeated:
+        N_PLUS_ONE.inc((endpoint,))
+        for count, shape in sorted(repeated, reverse=True):
+            app.logger.warning('Possible N+1 in %s %s: ran %d times: %s', request.method, request.path, count, shape[:300])
+    if app.debug or app.config['QUERY_DEBUG_HEADERS']:
+        response.headers['X-Query-Count'] = str(g.query_count)
+        response.headers['Server-Timing'] = (f'db;dur={g.query_seconds * 1000:.1f};desc="{g.query_count} queries", '
+                                             f'app;dur={elapsed * 1000:.1f}')
+    return response
+
+def render_metrics():
+    families = [metric.render() for metric in METRICS]
+    for name, help_text, value in (
+            ('projtree_graph_version', 'Latest change_log id.', get_graph_version()),
+            ('projtree_principal_cache_hits_total', 'Principal cache hits.', principal_cache.hits),
+            ('projtree_principal_cache_misses_total', 'Principal cache misses.', principal_cache.misses),
+            ('projtree_password_hashes_rejected_total', 'Password hashes refused because the pool was full.',
+             password_hasher.rejected),
+            ('projtree_dashboard_cache_hits_total', 'Dashboard fragments served from cache.', dashboard_cache.hits),
+            ('projtree_dashboard_cache_misses_total', 'Dashboard fragments rendered.', dashboard_cache.misses),
+            ('projtree_event_streams', 'Open event streams.', event_broker.streams),
+            ('projtree_event_streams_rejected_total', 'Event streams refused at EVENT_MAX_STREAMS.',
+             event_broker.rejected_streams),
+            ('projtree_jobs_queued', 'Background jobs waiting for a worker in this process.', job_runner.queued)):
+        kind = 'counter' if name.endswith('_total') else 'gauge'
+        families.append(f'# HELP {name} {help_text}\n# TYPE {name} {kind}\n{name} {value}')
+    return '\n'.join(families) + '\n'
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: needs the METRICS_TOKEN bearer token, or else an admin session."""
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({'success': False, 'message': 'Metrics token required'}), 401
+    elif not current_user.is_authenticated or current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Set METRICS_TOKEN or log in as an admin'}), 401
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# ==================== BENCHMARKS ====================
+
+BENCH_SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tor', 'vex', 'zu', 'pa', 'qui', 'sha', 'dor', 'fen']
+BENCH_WORDS = [a + b for a in BENCH_SYLLABLES for b in BENCH_SYLLABLES]
+
+def parse_status_mix(text):
+    """'not_started=50,started=20,...' -> ({status: weight}); unknown statuses are an error."""
+    mix = {}
+    for part in text.split(','):
+        status, _, weight = part.partition('=')
+        if status.strip() not in STATUS_ORDER:
+            raise ValueError(f'Unknown status {status.strip()!r}')
+        mix[status.strip()] = float(weight or 1)
+    return mix
+
+def seed_synthetic_project(nodes, depth, max_parents, max_children, status_mix, doc_size, history, users, seed):
+    """Bulk-insert a generated project into an empty database and build its derived indexes."""
+    rng = random.Random(seed)
+    _, edges = generate_layered_dag(nodes, seed, max(1, math.ceil(nodes / max(depth, 1))), max_parents, max_children)
+    now = datetime.utcnow()
+    password_hash = generate_password_hash('bench')
+    db.session.execute(User.__table__.insert(), [
+        {'id': index + 1, 'username': 'admin' if index == 0 else f'bench{index}', 'password_hash': password_hash,
+         'role': 'admin' if index == 0 else 'developer'} for index in range(users)])
+    statuses = rng.choices(list(status_mix), weights=list(status_mix.values()), k=nodes)
+
+    def words(count):
+        return ' '.join(rng.choice(BENCH_WORDS) for _ in range(count))
+
+    db.session.execute(Task.__table__.insert(), [
+        {'id': node + 1, 'title': f'{words(2)} {node + 1}', 'description': words(12),
+         'creator_id': rng.randint(1, users), 'assignee_id': rng.choice([None, rng.randint(1, users)]),
+         'status': statuses[node], 'override_warning': False, 'created_at': now, 'updated_at': now}
+        for node in range(nodes)])
+    if edges:
+        db.session.execute(task_parents.insert(), [{'parent_id': p + 1, 'child_id': c + 1} for p, c in edges])
+    db.session.execute(Documentation.__table__.insert(), [
+        {'task_id': node + 1, 'content': words(max(doc_size // 7, 1)), 'updated_at': now} for node in range(nodes)])
+    if history:
+        db.session.execute(StatusHistory.__table__.insert(), [
+            {'task_id': node + 1, 'old_status': STATUS_ORDER[step % 4], 'new_status': STATUS_ORDER[step % 4 + 1],
+             'user_id': rng.randint(1, users), 'timestamp': now}
+            for node in range(nodes) for step in range(history)])
+    rebuild_closure()
+    recompute_rollups()
+    rebuild_flow_rollups()
+    db.session.commit()
+    if fts_available():
+        rebuild_search_index()
+        db.session.commit()
+    return [(p + 1, c + 1) for p, c in edges]
+
+def bench_scenarios(task_ids, parents_of):
+    """(name, request function, admin only) for each scenario.
+
+    Request functions take a test client and an RNG. Writes run as the admin
+    so that permission checks do not turn them into cheap 403s.
+    """
+    def update_with_cycle_check(client, rng):
+        task_id = rng.choice(task_ids)
+        parent_ids = parents_of.get(task_id, []) + [rng.choice(task_ids)]
+        return client.put(f'/api/task/{task_id}', json={'parent_ids': parent_ids, 'description': rng.choice(BENCH_WORDS)})
+
+    return [
+        ('get_tasks', lambda client, rng: client.get('/api/tasks'), False),
+        ('get_task', lambda client, rng: client.get(f'/api/task/{rng.choice(task_ids)}'), False),
+        ('subgraph', lambda client, rng: client.get(f'/api/task/{rng.choice(task_ids)}/subgraph'), False),
+        ('search', lambda client, rng: client.get(f'/api/search?q={rng.choice(BENCH_WORDS)}'), False),
+        ('update_task', update_with_cycle_check, True),
+        ('dashboard', lambda client, rng: client.get('/dashboard'), False),
+        ('ready', lambda client, rng: client.get('/api/ready?assignee=me,unassigned'), False)
+    ]
+
+def run_bench_scenario(action, user_ids, workers, count, seed):
+    """Issue `count` requests from `workers` threads; returns latencies, query counts and failures."""
+    latencies = []
+    queries = []
+    failures = []
+    lock = threading.Lock()
+    remaining = [count]
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_ids[index % len(user_ids)])
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            response = action(client, rng)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status_code >= 400:
+                    failures.append(response.status_code)
+                else:
+                    latencies.append(elapsed)
+                    queries.append(int(response.headers.get('X-Query-Count', 0)))
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, queries, failures, time.perf_counter() - started
+
+def peak_request_memory(action, user_id, seed):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    tracemalloc.start()
+    try:
+        action(client, random.Random(seed))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def compare_bench_results(previous, current, tolerance):
+    """Lines describing latency changes between two result files; regressions are marked."""
+    lines = []
+    before = {scenario['name']: scenario for scenario in previous['scenarios']}
+    for scenario in current['scenarios']:
+        old = before.get(scenario['name'])
+        if not old or not old['p95_ms'] or not scenario['p95_ms']:
+            continue
+        change = scenario['p95_ms'] / old['p95_ms'] - 1
+        flag = '  REGRESSION' if change > tolerance else ''
+        lines.append(f'{scenario["name"]:<12} p95 {old["p95_ms"]:8.2f}ms -> {scenario["p95_ms"]:8.2f}ms '
+                     f'({change:+.0%}){flag}')
+    return lines
+
+@app.cli.command('bench')
+@click.option('--nodes', default=2000, help='Tasks to generate.')
+@click.option('--depth', default=12, help='Layers in the generated graph.')
+@click.option('--max-parents', default=3, help='Fan-in: most parents per task.')
+@click.option('--max-children', default=8, help='Fan-out: most children per task.')
+@click.option('--status-mix', default='not_started=40,started=25,functional=15,documented=10,integrated=10',
+              help='Relative weights of each status.')
+@click.option('--doc-size', default=2000, help='Approximate documentation length in characters.')
+@click.option('--history', default=3, help='Status history entries per task.')
+@click.option('--users', default=10, help='Users to generate; requests rotate through them.')
+@click.option('--workers', default=4, help='Concurrent client threads.')
+@click.option('--requests', 'count', default=200, help='Requests per scenario.')
+@click.option('--seed', default=0, help='Random seed for the project and the request mix.')
+@click.option('--reset', is_flag=True, help='Drop all data first instead of requiring an empty database.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Results file (default bench-<time>.json).')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help='Earlier results to diff against.')
+@click.option('--tolerance', default=0.2, help='p95 slowdown reported as a regression when comparing.')
+def bench_command(nodes, depth, max_parents, max_children, status_mix, doc_size, history, users, workers, count,
+                  seed, reset, output, compare, tolerance):
+    """Seed a synthetic project, drive the main routes concurrently and save latency results as JSON."""
+    try:
+        mix = parse_status_mix(status_mix)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if reset:
+        db.drop_all()
+        if db.engine.dialect.name == 'sqlite':
+            drop_search_index()
+    run_migrations()
+    if db.session.query(Task.id).first() or db.session.query(User.id).first():
+        raise click.ClickException('Database is not empty; point DATABASE_URL at a scratch database or pass --reset')
+    started = time.perf_counter()
+    edges = seed_synthetic_project(nodes, depth, max_parents, max_children, mix, doc_size, history, users, seed)
+    seed_seconds = time.perf_counter() - started
+    click.echo(f'Seeded {nodes} tasks and {len(edges)} edges in {seed_seconds:.1f}s')
+    parents_of = defaultdict(list)
+    for parent, child in edges:
+        parents_of[child].append(parent)
+    task_ids = list(range(1, nodes + 1))
+    user_ids = list(range(1, users + 1))
+    db.session.remove()
+
+    results = []
+    debug_headers = app.config['QUERY_DEBUG_HEADERS']
+    app.config['QUERY_DEBUG_HEADERS'] = True
+    app.logger.disabled = True
+    try:
+        for name, action, admin_only in bench_scenarios(task_ids, parents_of):
+            latencies, queries, failures, wall = run_bench_scenario(
+                action, user_ids[:1] if admin_only else user_ids, workers, count, seed)
+            results.append({
+                'name': name,
+                'requests': count,
+                'failures': len(failures),
+                'failure_statuses': sorted(set(failures)),
+                'throughput_rps': round(len(latencies) / wall, 2),
+                'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+                'queries_max': max(queries, default=None),
+                'peak_request_bytes': peak_request_memory(action, user_ids[0], seed)
+            })
+            result = results[-1]
+            click.echo(f'{name:<12} {result["throughput_rps"]:8.1f} req/s  p50 {result["p50_ms"]:8.2f}ms  '
+                       f'p95 {result["p95_ms"]:8.2f}ms  p99 {result["p99_ms"]:8.2f}ms  '
+                       f'{result["queries_mean"]} queries  {result["peak_request_bytes"] / 1024:.0f} KiB peak  '
+                       f'{result["failures"]} failed')
+    finally:
+        app.config['QUERY_DEBUG_HEADERS'] = debug_headers
+        app.logger.disabled = False
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'parameters': {'nodes': nodes, 'edges': len(edges), 'depth': depth, 'max_parents': max_parents,
+                       'max_children': max_children, 'status_mix': mix, 'doc_size': doc_size, 'history': history,
+                       'users': users, 'workers': workers, 'requests': count, 'seed': seed},
+        'environment': {'python': platform.python_version(), 'database': db.engine.dialect.name,
+                        'json_encoder': app.config['JSON_ENCODER'], 'search': 'fts5' if fts_available() else 'inverted'},
+        'seed_seconds': round(seed_seconds, 3),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        'scenarios': results
+    }
+    output = output or f'bench-{datetime.utcnow():%Y%m%d-%H%M%S}.json'
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    click.echo(f'Wrote {output}')
+    if compare:
+        with open(compare) as f:
+            for line in compare_bench_results(json.load(f), report, tolerance):
+                click.echo(line)
+
+# ==================== DASHBOARD ====================
+
+def load_dashboard_tasks(user_id):
+    """The user's assigned tasks with their materialized child count and progress, in one query."""
+    return db.session.query(Task.id, Task.title, Task.description, Task.status, Task.created_at,
+                            Task.child_count, Task.progress).filter(
+        Task.assignee_id == user_id).order_by(Task.id).all()
+
+def load_recent_tasks(limit=10):
+    return db.session.query(Task.id, Task.title, Task.description, Task.status, Task.updated_at,
+                            User.username.label('creator')).outerjoin(User, User.id == Task.creator_id).order_by(
+        Task.updated_at.desc()).limit(limit).all()
+
+def count_statuses(tasks):
+    counts = defaultdict(int)
+    for task in tasks:
+        counts[task.status] += 1
+    return {
+        'total': len(tasks),
+        'not_started': counts['not_started'],
+        'in_progress': counts['started'] + counts['functional'],
+        'integrated': counts['integrated']
+    }
+
+class DashboardCache:
+    """Rendered dashboard fragments: one per user for their own tasks, one shared for recent activity.
+
+    A user's fragment stays valid until the change log shows a change to one
+    of their tasks or to those tasks' children, an edge change under one of
+    their tasks, or a task being assigned to them. Recent activity is
+    re-rendered whenever the graph version moves.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mine = OrderedDict()
+        self.recent = None
+        self.hits = 0
+        self.misses = 0
+
+    def my_tasks(self, user_id, version):
+        with self.lock:
+            entry = self.mine.get(user_id)
+        if entry is not None and (entry[0] == version or not self.affected(user_id, *entry[:3])):
+            with self.lock:
+                self.mine[user_id] = (version,) + entry[1:]
+                self.mine.move_to_end(user_id)
+                self.hits += 1
+            return entry[3]
+        tasks = load_dashboard_tasks(user_id)
+        mine = {task.id for task in tasks}
+        children = {child_id for (child_id,) in db.session.query(task_parents.c.child_id).filter(
+            task_parents.c.parent_id.in_(mine))} if mine else set()
+        html = render_template('dashboard_my_tasks.html', my_tasks=tasks, counts=count_statuses(tasks))
+        with self.lock:
+            self.misses += 1
+            self.mine[user_id] = (version, mine, children, html)
+            self.mine.move_to_end(user_id)
+            while len(self.mine) > app.config['DASHBOARD_CACHE_SIZE']:
+                self.mine.popitem(last=False)
+        return html
+
+    def recent_activity(self, version):
+        with self.lock:
+            if self.recent is not None and self.recent[0] == version:
+                self.hits += 1
+                return self.recent[1]
+        html = render_template('dashboard_recent.html', recent=load_recent_tasks())
+        with self.lock:
+            self.misses += 1
+            self.recent = (version, html)
+        return html
+
+    def affected(self, user_id, since, mine, children):
+        oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+        if oldest is not None and since < oldest - 1:
             return True
-        visited = set()
-        to_visit = [potential_parent_id]
-        while to_visit:
-            current_id = to_visit.pop()
-            if current_id == self.id:
-                return True
-            if current_id in visited:
-                continue
-            visited.add(current_id)
-            task = Task.query.get(current_id)
-            if task:
-                parent_ids = [p.id for p in task.parents]
-                to_visit.extend(parent_ids)
-        return False
+        limit = app.config['DASHBOARD_MAX_CHANGES']
+        changes = db.session.query(ChangeLog.kind, ChangeLog.task_id, ChangeLog.parent_id).filter(
+            ChangeLog.id > since).limit(limit + 1).all()
+        if len(changes) > limit or any(task_id in mine or task_id in children or parent_id in mine
+                                       or kind in FULL_REFRESH_CHANGES for kind, task_id, parent_id in changes):
+            return True
+        # Tasks newly assigned to this user are not in `mine` yet
+        assigned = {task_id for kind, task_id, _ in changes if kind == 'task_assigned'}
+        return bool(assigned) and db.session.query(db.exists().where(
+            Task.id.in_(assigned), Task.assignee_id == user_id)).scalar()
 
-    def has_unfinished_children(self):
-        children = self.children.all()
-        status_order = ['not_started', 'started', 'functional', 'documented', 'integrated']
-        functional_index = status_order.index('functional')
-        for child in children:
-            if status_order.index(child.status) < functional_index:
-                return True
-        return False
+    def stats(self):
+        with self.lock:
+            return {'users': len(self.mine), 'hits': self.hits, 'misses': self.misses}
 
-    def get_next_status_highlight(self, current_user_id=None):
-        if self.assignee_id and self.assignee_id != current_user_id:
-            return None
-        children = self.children.all()
-        if children:
-            if not self.has_unfinished_children():
-                status_progression = {
-                    'not_started': 'started',
-                    'started': 'functional',
-                    'functional': 'documented',
-                    'documented': 'integrated'
-                }
-                return status_progression.get(self.status)
-        else:
-            if not self.override_warning:
-                status_progression = {
-                    'not_started': 'started',
-                    'started': 'functional',
-                    'functional': 'documented',
-                    'documented': 'integrated'
-                }
-                return status_progression.get(self.status)
+dashboard_cache = DashboardCache()
+
+# ==================== CONCURRENCY ====================
+
+WRITE_CONFLICTS = CounterMetric('projtree_write_conflicts_total',
+                                'Optimistic version check failures and lock timeouts, retried or returned as 409/503.',
+                                ('endpoint', 'outcome'))
+METRICS.append(WRITE_CONFLICTS)
+
+def is_database_locked(error):
+    """True for an OperationalError that means another writer held the lock too long."""
+    orig = getattr(error, 'orig', None)
+    return 'database is locked' in str(orig) or getattr(orig, 'pgcode', None) in ('40001', '40P01', '55P03')
+
+def database_busy_response():
+    response = jsonify({'success': False, 'message': 'The database is busy; try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(app.config['DATABASE_BUSY_RETRY_AFTER'])
+    return response
+
+@app.errorhandler(OperationalError)
+def handle_operational_error(error):
+    if not is_database_locked(error):
+        raise error
+    db.session.rollback()
+    WRITE_CONFLICTS.inc((request.endpoint, 'busy'))
+    return database_busy_response()
+
+def conflict_response(message='Task was changed by someone else; reload and try again', **extra):
+    return jsonify({'success': False, 'conflict': True, 'message': message, **extra}), 409
+
+def retry_on_conflict(view):
+    """Re-run a task write from scratch when an optimistic version check fails.
+
+    Each attempt re-reads and re-validates, so a retry only commits if its
+    checks still pass. After TASK_WRITE_RETRIES attempts the client gets 409,
+    or 503 with Retry-After if the last attempt found the database locked.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        attempts = app.config['TASK_WRITE_RETRIES']
+        for attempt in range(attempts):
+            try:
+                return view(*args, **kwargs)
+            except StaleDataError:
+                db.session.rollback()
+                locked = False
+            except OperationalError as e:
+                if not is_database_locked(e):
+                    raise
+                db.session.rollback()
+                locked = True
+            if attempt + 1 < attempts:
+                WRITE_CONFLICTS.inc((request.endpoint, 'retried'))
+                time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+        WRITE_CONFLICTS.inc((request.endpoint, 'busy' if locked else 'rejected'))
+        return database_busy_response() if locked else conflict_response()
+    return wrapper
+
+def verify_versions(expected):
+    """Raise StaleDataError if any task in {task_id: version} changed since it was read.
+
+    Like claim_task, each row gets a conditional UPDATE ... WHERE version = :v.
+    It writes the row's own values back, so the version does not move, but the
+    row is write-locked until commit on SQLite and PostgreSQL alike and cannot
+    change between this check and the commit.
+    """
+    if not expected:
+        return
+    db.session.flush()
+    table = Task.__table__
+    statement = table.update().where(
+        table.c.id == db.bindparam('row_id'), table.c.version == db.bindparam('row_version')
+    ).values(version=table.c.version, updated_at=table.c.updated_at)
+    # Fixed order, so concurrent checks lock rows in the same sequence
+    rows = [{'row_id': task_id, 'row_version': version} for task_id, version in sorted(expected.items())]
+    if db.engine.dialect.supports_sane_multi_rowcount:
+        matched = db.session.execute(statement, rows).rowcount
+    else:
+        matched = sum(db.session.execute(statement, row).rowcount for row in rows)
+    if matched != len(rows):
+        raise StaleDataError(f'{len(rows) - matched} of tasks {sorted(expected)} changed while they were being checked')
+
+def claim_task(task_id, user_id):
+    """Atomically assign an unassigned, not started task. Returns False if someone else got there first."""
+    result = db.session.execute(Task.__table__.update().where(
+        Task.id == task_id, Task.assignee_id.is_(None), Task.status == 'not_started'
+    ).values(assignee_id=user_id, version=Task.version + 1, updated_at=datetime.utcnow()))
+    return result.rowcount == 1
+
+def seed_stress_fixtures(threads, claims, integrations):
+    """Users and tasks for stress-writes: a counter task, tasks to claim and parent/child pairs."""
+    password_hash = generate_password_hash('stress')
+    admin = User(username='admin', role='admin', password_hash=password_hash)
+    developers = [User(username=f'stress{index}', role='developer', password_hash=password_hash)
+                  for index in range(threads)]
+    db.session.add_all([admin] + developers)
+    db.session.flush()
+    counter = Task(title='Stress counter', description='0', creator_id=admin.id)
+    to_claim = [Task(title=f'Claim {index}', creator_id=admin.id) for index in range(claims)]
+    pairs = [(Task(title=f'Parent {index}', status='documented', creator_id=admin.id),
+              Task(title=f'Child {index}', status='integrated', creator_id=admin.id)) for index in range(integrations)]
+    db.session.add_all([counter] + to_claim + [task for pair in pairs for task in pair])
+    db.session.flush()
+    if pairs:
+        db.session.execute(task_parents.insert(), [{'parent_id': parent.id, 'child_id': child.id}
+                                                   for parent, child in pairs])
+    rebuild_closure()
+    recompute_rollups()
+    db.session.commit()
+    return (admin.id, [user.id for user in developers], counter.id, [task.id for task in to_claim],
+            [(parent.id, child.id) for parent, child in pairs])
+
+def logged_in_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    return client
+
+def run_threads(target, argument_lists):
+    threads = [threading.Thread(target=target, args=arguments) for arguments in argument_lists]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+@app.cli.command('stress-writes')
+@click.option('--threads', default=16, help='Concurrent writers.')
+@click.option('--increments', default=25, help='Versioned read-modify-write increments per thread.')
+@click.option('--claims', default=50, help='Tasks every thread tries to claim.')
+@click.option('--integrations', default=20, help='Races between integrating a parent and reopening its child.')
+@click.option('--reset', is_flag=True, help='Drop all data first instead of requiring an empty database.')
+def stress_writes_command(threads, increments, claims, integrations, reset):
+    """Race concurrent task writes and check that none are lost, doubled or wrongly validated."""
+    if reset:
+        db.drop_all()
+        if db.engine.dialect.name == 'sqlite':
+            drop_search_index()
+    run_migrations()
+    if db.session.query(Task.id).first() or db.session.query(User.id).first():
+        raise click.ClickException('Database is not empty; point DATABASE_URL at a scratch database or pass --reset')
+    admin_id, developer_ids, counter_id, claim_ids, pairs = seed_stress_fixtures(threads, claims, integrations)
+    db.session.remove()
+    lock = threading.Lock()
+    errors = defaultdict(int)
+    failures = []
+    app.logger.disabled = True
+    try:
+        conflicts = [0]
+
+        def increment(_):
+            client = logged_in_client(admin_id)
+            done = 0
+            while done < increments:
+                task = client.get(f'/api/task/{counter_id}').get_json()
+                response = client.put(f'/api/task/{counter_id}', json={
+                    'description': str(int(task['description']) + 1), 'version': task['version']})
+                with lock:
+                    if response.status_code == 200:
+                        done += 1
+                    elif response.status_code == 409:
+                        conflicts[0] += 1
+                    else:
+                        errors[f'increment {response.status_code}'] += 1
+                        return
+
+        started = time.perf_counter()
+        run_threads(increment, [(index,) for index in range(threads)])
+        total = int(db.session.get(Task, counter_id).description)
+        click.echo(f'increments: {total}/{threads * increments} applied, {conflicts[0]} conflicts resolved by '
+                   f'clients, {time.perf_counter() - started:.1f}s')
+        if total != threads * increments - sum(count for key, count in errors.items() if key.startswith('increment')):
+            failures.append(f'lost updates: counter is {total}')
+        db.session.remove()
+
+        winners = defaultdict(list)
+
+        def claim(user_id):
+            client = logged_in_client(user_id)
+            for task_id in random.sample(claim_ids, len(claim_ids)):
+                response = client.post(f'/api/task/{task_id}/request')
+                with lock:
+                    if response.status_code == 200:
+                        winners[task_id].append(user_id)
+                    elif response.status_code != 409:
+                        errors[f'claim {response.status_code}'] += 1
+
+        started = time.perf_counter()
+        run_threads(claim, [(user_id,) for user_id in developer_ids])
+        assignees = dict(db.session.query(Task.id, Task.assignee_id).filter(Task.id.in_(claim_ids)))
+        doubled = [task_id for task_id in claim_ids if len(winners[task_id]) > 1]
+        mismatched = [task_id for task_id in claim_ids if winners[task_id] and assignees[task_id] != winners[task_id][0]]
+        click.echo(f'claims: {sum(map(len, winners.values()))} granted for {len(claim_ids)} tasks, '
+                   f'{len(doubled)} double assignments, {time.perf_counter() - started:.1f}s')
+        if doubled or mismatched:
+            failures.append(f'double assignments: {doubled or mismatched}')
+        db.session.remove()
+
+        def race(parent_id, child_id, barrier):
+            client = logged_in_client(admin_id)
+            barrier.wait()
+            if parent_id:
+                response = client.put(f'/api/task/{parent_id}', json={'status': 'integrated'})
+            else:
+                response = client.put(f'/api/task/{child_id}', json={'status': 'started', 'override_warning': True})
+            if response.status_code >= 500:
+                with lock:
+                    errors[f'integrate {response.status_code}'] += 1
+
+        started = time.perf_counter()
+        for parent_id, child_id in pairs:
+            barrier = threading.Barrier(2)
+            run_threads(race, [(parent_id, child_id, barrier), (None, child_id, barrier)])
+        # Reopening a child after its parent was integrated is allowed; integrating a
+        # parent whose child had already been reopened is the lost check
+        changed_at = dict(db.session.query(StatusHistory.task_id, db.func.max(StatusHistory.id)).filter(
+            StatusHistory.task_id.in_([task_id for pair in pairs for task_id in pair])).group_by(StatusHistory.task_id))
+        integrated = [(parent_id, child_id) for parent_id, child_id in pairs if parent_id in changed_at]
+        invalid = [parent_id for parent_id, child_id in integrated
+                   if child_id in changed_at and changed_at[child_id] < changed_at[parent_id]]
+        click.echo(f'integrations: {len(integrated)}/{len(pairs)} parents integrated, {len(invalid)} after their '
+                   f'child was reopened, {time.perf_counter() - started:.1f}s')
+        if invalid:
+            failures.append(f'parents integrated over a reopened child: {invalid}')
+    finally:
+        app.logger.disabled = False
+    for key, count in sorted(errors.items()):
+        click.echo(f'errors: {count} x {key}')
+    for _, (endpoint, outcome), _, count in WRITE_CONFLICTS.samples():
+        click.echo(f'version conflicts {outcome} in {endpoint}: {count:g}')
+    if failures:
+        raise click.ClickException('; '.join(failures))
+
+# ==================== JOBS ====================
+
+JOB_KINDS = {}
+
+JOBS_FINISHED = CounterMetric('projtree_jobs_total', 'Background jobs finished, by outcome.', ('kind', 'status'))
+JOB_SECONDS = HistogramMetric('projtree_job_seconds', 'Background job run time.', ('kind',),
+                              buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+METRICS.extend((JOBS_FINISHED, JOB_SECONDS))
+
+class JobCancelled(Exception):
+    """Raised from a progress report once a job has been asked to stop."""
+
+def background_job(kind):
+    """Register a background job. It is called as func(progress, **params) and returns a JSON-able result.
+
+    progress(fraction, message=None) records how far the job has got and is the
+    point where cancellation takes effect, so long jobs should call it often.
+    The runner commits after the job returns and rolls back if it raises.
+    """
+    def register(func):
+        JOB_KINDS[kind] = func
+        return func
+    return register
+
+class JobRunner:
+    """Runs queued jobs on a small thread pool in this process.
+
+    Job records live in the job table, so any worker can report on or cancel a
+    job; live progress between reports is only visible in the process running
+    it and is written to the record when the job finishes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.live = {}
+        self.cancelled = set()
+        self.cancel_checked = {}
+        self.queued = 0
+
+    def submit(self, job_ids):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'], thread_name_prefix='job')
+            self.queued += len(job_ids)
+        for job_id in job_ids:
+            self.executor.submit(self.run, job_id)
+
+    def run(self, job_id):
+        with self.lock:
+            self.queued -= 1
+        with app.app_context():
+            try:
+                self.execute(job_id)
+            except Exception:
+                app.logger.exception('Job %s could not be run', job_id)
+
+    def execute(self, job_id):
+        """Claim and run one queued job. Returns False if another worker got to it first."""
+        table = Job.__table__
+        claimed = db.session.execute(table.update().where(table.c.id == job_id, table.c.status == 'queued').values(
+            status='running', started_at=datetime.utcnow())).rowcount
+        db.session.commit()
+        if not claimed:
+            return False
+        job = db.session.get(Job, job_id)
+        kind = job.kind
+        with self.lock:
+            self.live[job_id] = (0.0, None)
+        started = time.perf_counter()
+        try:
+            result = JOB_KINDS[kind](functools.partial(self.report, job_id), **json.loads(job.params or '{}'))
+            db.session.commit()
+            values = {'status': 'succeeded', 'progress': 1.0, 'result': json.dumps(result)}
+        except JobCancelled:
+            db.session.rollback()
+            values = {'status': 'cancelled'}
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('Job %s (%s) failed', job_id, kind)
+            values = {'status': 'failed', 'error': str(e) or type(e).__name__}
+        with self.lock:
+            progress, message = self.live.pop(job_id)
+            self.cancelled.discard(job_id)
+            self.cancel_checked.pop(job_id, None)
+        values.setdefault('progress', progress)
+        db.session.execute(table.update().where(table.c.id == job_id).values(
+            finished_at=datetime.utcnow(), message=message, **values))
+        db.session.commit()
+        JOBS_FINISHED.inc((kind, values['status']))
+        JOB_SECONDS.observe((kind,), time.perf_counter() - started)
+        prune_jobs()
+        return True
+
+    def report(self, job_id, fraction, message=None):
+        """Record progress for a running job; raises JobCancelled if it was asked to stop.
+
+        Cancellations from other processes are picked up by re-reading the job
+        record at most every JOB_CANCEL_POLL_SECONDS, on a separate connection
+        so the job's own transaction is left alone.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.live[job_id] = (max(0.0, min(fraction, 1.0)), message)
+            cancelled = job_id in self.cancelled
+            poll = not cancelled and now - self.cancel_checked.get(job_id, 0) >= app.config['JOB_CANCEL_POLL_SECONDS']
+            if poll:
+                self.cancel_checked[job_id] = now
+        if poll:
+            with db.engine.connect() as connection:
+                cancelled = connection.execute(db.select(Job.cancel_requested).where(Job.id == job_id)).scalar()
+        if cancelled:
+            raise JobCancelled()
+
+    def progress(self, job_id):
+        with self.lock:
+            return self.live.get(job_id)
+
+    def cancel(self, job_id):
+        with self.lock:
+            if job_id in self.live:
+                self.cancelled.add(job_id)
+
+job_runner = JobRunner()
+
+@event.listens_for(Session, 'after_commit')
+def submit_pending_jobs(session):
+    job_ids = session.info.pop('pending_jobs', None)
+    if job_ids:
+        job_runner.submit(job_ids)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_pending_jobs(session):
+    session.info.pop('pending_jobs', None)
+
+def enqueue_job(kind, params=None, key=None, coalesce=('queued',)):
+    """Queue a job to start once the current transaction commits.
+
+    A job under the same key (by default, the kind and params) in one of the
+    `coalesce` states absorbs the request, so a burst of edits costs one run.
+    Running jobs are left out by default, since they may have read the data
+    before this change; pass them in when the key already pins the input.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f'Unknown job kind {kind!r}')
+    encoded = json.dumps(params or {}, sort_keys=True)
+    key = key or f'{kind}:{hashlib.sha1(encoded.encode()).hexdigest()[:16]}'
+    existing = Job.query.filter(Job.key == key, Job.status.in_(coalesce)).order_by(Job.id).first()
+    if existing:
+        return existing
+    job = Job(kind=kind, key=key, params=encoded,
+              created_by=current_user.id if has_request_context() and current_user.is_authenticated else None)
+    db.session.add(job)
+    db.session.flush()
+    db.session.info.setdefault('pending_jobs', []).append(job.id)
+    return job
+
+def cancel_job(job):
+    """Cancel a queued job outright, or ask a running one to stop at its next progress report."""
+    table = Job.__table__
+    if db.session.execute(table.update().where(table.c.id == job.id, table.c.status == 'queued').values(
+            status='cancelled', finished_at=datetime.utcnow())).rowcount:
+        JOBS_FINISHED.inc((job.kind, 'cancelled'))
+    else:
+        db.session.execute(table.update().where(table.c.id == job.id, table.c.status == 'running').values(
+            cancel_requested=True))
+    db.session.commit()
+    job_runner.cancel(job.id)
+    db.session.refresh(job)
+
+def prune_jobs():
+    """Drop finished jobs older than JOB_RETENTION_DAYS, then their export files.
+
+    Runs in the job runner in a transaction of its own; files are only removed
+    once the rows are gone for good.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=app.config['JOB_RETENTION_DAYS'])
+    expired = Job.query.filter(Job.finished_at < cutoff).all()
+    if not expired:
+        return
+    paths = [job_export_path(job) for job in expired]
+    db.session.execute(Job.__table__.delete().where(Job.id.in_([job.id for job in expired])))
+    db.session.commit()
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def job_export_path(job):
+    result = json.loads(job.result) if job.result else None
+    if job.kind != 'export' or not result:
         return None
+    return os.path.join(app.config['JOB_EXPORT_DIR'], result['file'])
 
-class Documentation(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
-    content = db.Column(db.Text)
-    template_hint = db.Column(db.Text, default="List any externally accessible features here.\n\n\nVariables:\n\nFunctions:\n\nExample use cases:\n")
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+def serialize_job(job):
+    progress, message = job_runner.progress(job.id) or (job.progress, job.message)
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': progress,
+        'message': message,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'cancel_requested': job.cancel_requested,
+        'created_by': job.created_by,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
 
-class StatusHistory(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
-    old_status = db.Column(db.String(20))
-    new_status = db.Column(db.String(20), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    user = db.relationship('User')
+@background_job('recompute_rollups')
+def recompute_rollups_job(progress):
+    """Full rollup recompute that cannot overwrite edits made while it was reading.
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+    recompute_rollups reads the graph before it writes, so a status or edge
+    committed in between would be clobbered with stale values. Once its writes
+    are in, no other writer can commit until this job does (SQLite's write
+    lock, PostgreSQL's change log lock), so re-running the incremental refresh
+    for everything logged since the read started closes the gap.
+    """
+    progress(0, 'Recomputing rollups')
+    version = get_graph_version()
+    count = recompute_rollups()
+    progress(0.9, 'Catching up with concurrent edits')
+    refresh_rollups_since(version)
+    return {'tasks': count}
+
+@background_job('rebuild_search')
+def rebuild_search_job(progress):
+    progress(0, 'Rebuilding search index')
+    available = ensure_search_index()
+    if available:
+        rebuild_search_index()
+    return {'fts': available}
+
+@background_job('rebuild_flow')
+def rebuild_flow_job(progress):
+    progress(0, 'Rebuilding flow analytics')
+    rebuild_flow_rollups()
+    return {}
+
+@background_job('export')
+def export_job(progress, compress=False):
+    """Write an NDJSON export under JOB_EXPORT_DIR for download through /api/jobs/<id>/download."""
+    total = sum(db.session.query(db.func.count()).select_from(table).scalar()
+                for _, table, _ in export_tables()) + 1
+    directory = app.config['JOB_EXPORT_DIR']
+    os.makedirs(directory, exist_ok=True)
+    filename = f'projtree-export-{datetime.utcnow():%Y%m%d-%H%M%S}-{os.urandom(4).hex()}.ndjson'
+    if compress:
+        filename += '.gz'
+    path = os.path.join(directory, filename)
+
+    def counted_lines():
+        for count, line in enumerate(iter_export_lines(include_secrets=False), 1):
+            if count % EXPORT_BATCH_SIZE == 0:
+                progress(count / total, f'{count} of {total} records')
+            yield line
+
+    try:
+        with open(path + '.part', 'wb') as f:
+            for chunk in iter_export_chunks(compress, lines=counted_lines()):
+                f.write(chunk)
+        os.replace(path + '.part', path)
+    finally:
+        if os.path.exists(path + '.part'):
+            os.remove(path + '.part')
+    return {'file': filename, 'bytes': os.path.getsize(path), 'records': total - 1}
+
+@app.cli.command('run-jobs')
+@click.option('--requeue-after', type=int, default=None,
+              help='Requeue jobs that have been running for more than this many minutes (their worker died).')
+def run_jobs_command(requeue_after):
+    """Run every queued job in this process, e.g. ones left behind by a restart."""
+    if requeue_after is not None:
+        table = Job.__table__
+        cutoff = datetime.utcnow() - timedelta(minutes=requeue_after)
+        count = db.session.execute(table.update().where(table.c.status == 'running', table.c.started_at < cutoff)
+                                   .values(status='queued', started_at=None)).rowcount
+        db.session.commit()
+        click.echo(f'Requeued {count} stale jobs')
+    while True:
+        job = Job.query.filter_by(status='queued').order_by(Job.id).first()
+        if not job:
+            break
+        job_id, kind = job.id, job.kind
+        started = time.perf_counter()
+        job_runner.execute(job_id)
+        click.echo(f'{job_id:>6} {kind:<20} {db.session.get(Job, job_id).status:<10} '
+                   f'{time.perf_counter() - started:.2f}s')
 
 # ==================== ROUTES ====================
 
@@ -167,8 +3833,15 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
-            login_user(user)
+        try:
+            valid = user is not None and password_hasher.check(user.password_hash, password)
+        except TimeoutError:
+            flash('Too many sign-ins in progress, please try again', 'error')
+            return hasher_busy_response(render_template('login.html'))
+        if valid:
+            principal = Principal(user)
+            principal_cache.put(principal)
+            login_user(principal)
             return redirect(url_for('index'))
         flash('Invalid username or password', 'error')
     return render_template('login.html')
@@ -184,10 +3857,16 @@ def logout():
 def change_password():
     old_password = request.form.get('old_password')
     new_password = request.form.get('new_password')
-    if not current_user.check_password(old_password):
-        return jsonify({'success': False, 'message': 'Incorrect current password'})
-    current_user.set_password(new_password)
+    user = db.session.get(User, current_user.id)
+    try:
+        if not password_hasher.check(user.password_hash, old_password):
+            return jsonify({'success': False, 'message': 'Incorrect current password'})
+        password_hash = password_hasher.generate(new_password)
+    except TimeoutError:
+        return hasher_busy_response(jsonify({'success': False, 'message': 'Server busy, please try again'}))
+    user.password_hash = password_hash
     db.session.commit()
+    principal_cache.invalidate(user.id)
     return jsonify({'success': True, 'message': 'Password changed successfully'})
 
 @app.route('/admin/add_user', methods=['POST'])
@@ -200,8 +3879,11 @@ def add_user():
     role = request.form.get('role', 'developer')
     if User.query.filter_by(username=username).first():
         return jsonify({'success': False, 'message': 'Username already exists'})
-    user = User(username=username, role=role)
-    user.set_password(password)
+    try:
+        password_hash = password_hasher.generate(password)
+    except TimeoutError:
+        return hasher_busy_response(jsonify({'success': False, 'message': 'Server busy, please try again'}))
+    user = User(username=username, role=role, password_hash=password_hash)
     db.session.add(user)
     db.session.commit()
     return jsonify({'success': True, 'message': 'User created successfully'})
@@ -220,6 +3902,13 @@ def get_users():
         'assigned_tasks_count': len(u.assigned_tasks)
     } for u in users])
 
+@app.route('/api/auth/stats')
+@login_required
+def auth_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    return jsonify({'principal_cache': principal_cache.stats(), 'password_hasher': password_hasher.stats()})
+
 @app.route('/api/user/<int:user_id>', methods=['PUT'])
 @login_required
 def update_user(user_id):
@@ -236,7 +3925,9 @@ def update_user(user_id):
             user.username = new_username
     if 'role' in data and data['role'] in ['admin', 'developer']:
         user.role = data['role']
+    record_change('user_changed')
     db.session.commit()
+    principal_cache.invalidate(user.id)
     return jsonify({'success': True, 'message': 'User updated successfully'})
 
 @app.route('/api/user/<int:user_id>', methods=['DELETE'])
@@ -247,50 +3938,50 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     if user.id == current_user.id:
         return jsonify({'success': False, 'message': 'Cannot delete your own account'})
+    # Job tables created before created_by had ON DELETE SET NULL still need this
+    Job.query.filter_by(created_by=user.id).update({'created_by': None}, synchronize_session=False)
     db.session.delete(user)
+    record_change('user_changed')
     db.session.commit()
+    principal_cache.invalidate(user_id)
     return jsonify({'success': True, 'message': 'User deleted successfully'})
 
 @app.route('/api/task/<int:task_id>/unassign', methods=['POST'])
 @login_required
+@retry_on_conflict
 def unassign_task(task_id):
     task = Task.query.get_or_404(task_id)
     if current_user.role != 'admin' and task.creator_id != current_user.id and task.assignee_id != current_user.id:
         return jsonify({'success': False, 'message': 'Permission denied'}), 403
     task.assignee_id = None
+    record_change('task_assigned', task_id=task.id)
     db.session.commit()
     return jsonify({'success': True, 'message': 'Task unassigned successfully'})
 
 @app.route('/api/tasks')
 @login_required
 def get_tasks():
-    tasks = Task.query.all()
-    result = []
-    for t in tasks:
-        parent_ids = [p.id for p in t.parents]
-        child_ids = [c.id for c in t.children.all()]
-        result.append({
-            'id': t.id,
-            'title': t.title,
-            'description': t.description,
-            'parent_ids': parent_ids,
-            'child_ids': child_ids,
-            'status': t.status,
-            'assignee': t.assignee.username if t.assignee else None,
-            'assignee_id': t.assignee_id,
-            'creator': t.creator.username,
-            'progress': t.get_progress(),
-            'created_at': t.created_at.isoformat(),
-            'can_edit': t.can_edit(current_user),
-            'next_status_highlight': t.get_next_status_highlight(current_user.id),
-            'override_warning': t.override_warning
-        })
-    return jsonify(result)
+    since = request.args.get('since', type=int)
+    if since is not None:
+        return conditional_response(graph_etag(), lambda: jsonify(build_task_delta(current_user, since)))
+    version = get_graph_version()
+    response = conditional_response(graph_etag(version), lambda: jsonify(build_task_snapshot(current_user)))
+    response.headers['X-Graph-Version'] = str(version)
+    return response
+
+@app.route('/api/layout')
+@login_required
+def get_layout():
+    return conditional_response(graph_etag(), lambda: jsonify(layout_cache.get()))
 
 @app.route('/api/task/<int:task_id>')
 @login_required
 def get_task(task_id):
+    return conditional_response(graph_etag(), lambda: serialize_task_detail(task_id))
+
+def serialize_task_detail(task_id):
     task = Task.query.get_or_404(task_id)
+    history, history_cursor = load_history_page(task.id)
     parent_ids = [p.id for p in task.parents]
     child_ids = [c.id for c in task.children.all()]
     return jsonify({
@@ -307,14 +3998,57 @@ def get_task(task_id):
         'can_edit': task.can_edit(current_user),
         'documentation': task.documentation.content if task.documentation else '',
         'override_warning': task.override_warning,
-        'history': [{
-            'old_status': h.old_status,
-            'new_status': h.new_status,
-            'user': h.user.username,
-            'timestamp': h.timestamp.isoformat()
-        } for h in task.status_history]
+        'history': history,
+        'history_cursor': history_cursor,
+        'version': task.version
     })
 
+@app.route('/api/task/<int:task_id>/history')
+@login_required
+def get_task_history(task_id):
+    Task.query.get_or_404(task_id)
+    limit = max(1, min(request.args.get('limit', app.config['HISTORY_PAGE_SIZE'], type=int), 200))
+    history, next_cursor = load_history_page(task_id, request.args.get('cursor', type=int), limit)
+    return jsonify({'history': history, 'next_cursor': next_cursor})
+
+@app.route('/api/analytics/flow')
+@login_required
+def get_flow_analytics():
+    weeks = max(1, min(request.args.get('weeks', 12, type=int), 520))
+    return jsonify(flow_analytics(weeks))
+
+@app.route('/api/ready')
+@login_required
+def get_ready_tasks():
+    try:
+        conditions = parse_assignee_filter(request.args.get('assignee', ''))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    return conditional_response(graph_etag(), lambda: jsonify(build_ready_frontier(conditions, limit)))
+
+@app.route('/api/critical-path')
+@login_required
+def get_critical_path():
+    root_id = request.args.get('root', type=int)
+    if root_id is not None:
+        Task.query.get_or_404(root_id)
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    return conditional_response(graph_etag(), lambda: jsonify(build_critical_paths(root_id, limit)))
+
+@app.route('/api/task/<int:task_id>/subgraph')
+@login_required
+def get_subgraph(task_id):
+    return conditional_response(graph_etag(), lambda: serialize_subgraph(task_id))
+
+def serialize_subgraph(task_id):
+    Task.query.get_or_404(task_id)
+    max_depth = app.config['SUBGRAPH_MAX_DEPTH']
+    up = max(0, min(request.args.get('up', app.config['SUBGRAPH_DEFAULT_DEPTH'], type=int), max_depth))
+    down = max(0, min(request.args.get('down', app.config['SUBGRAPH_DEFAULT_DEPTH'], type=int), max_depth))
+    limit = max(1, min(request.args.get('limit', 200, type=int), app.config['SUBGRAPH_MAX_NODES']))
+    return jsonify(build_subgraph(current_user, task_id, up, down, limit))
+
 @app.route('/api/task', methods=['POST'])
 @login_required
 def create_task():
@@ -333,23 +4067,33 @@ def create_task():
         if parent:
             if task.has_circular_relationship(parent_id):
                 return jsonify({'success': False, 'message': 'Circular relationship detected'})
-            task.parents.append(parent)
+            link_tasks(parent, task)
+    record_change('task_created', task_id=task.id)
     doc = Documentation(
         task_id=task.id,
         content='',
         template_hint="List any externally accessible features here.\n\n\nVariables:\n\nFunctions:\n\nExample use cases:\n"
     )
     db.session.add(doc)
+    index_task_text(task.id, task.title, task.description, doc.content)
     db.session.commit()
     return jsonify({'success': True, 'task_id': task.id})
 
 @app.route('/api/task/<int:task_id>', methods=['PUT'])
 @login_required
+@retry_on_conflict
 def update_task(task_id):
     task = Task.query.get_or_404(task_id)
     if not task.can_edit(current_user):
         return jsonify({'success': False, 'message': 'Permission denied'}), 403
     data = request.json
+    version = data.get('version')
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        return jsonify({'success': False, 'message': 'Version must be an integer'}), 400
+    if version is not None and version != task.version:
+        return conflict_response(version=task.version)
+    # Versions of the rows the status checks read; re-checked under the write lock before commit
+    checked_versions = {}
     if 'title' in data:
         task.title = data['title']
     if 'description' in data:
@@ -364,76 +4108,89 @@ def update_task(task_id):
         for parent_id in current_parents - new_parents:
             parent = Task.query.get(parent_id)
             if parent:
-                task.parents.remove(parent)
+                unlink_tasks(parent, task)
         for parent_id in new_parents - current_parents:
             parent = Task.query.get(parent_id)
             if parent:
-                task.parents.append(parent)
+                link_tasks(parent, task)
     if 'status' in data:
         new_status = data['status']
         override = data.get('override_warning', False)
         if new_status != task.status:
-            if task.has_unfinished_children() and not override:
-                children = task.children.all()
-                non_functional = [child for child in children if child.status not in ['functional', 'documented', 'integrated']]
-                child_titles = [child.title for child in non_functional[:3]]
-                message = f'This task has unfinished children: {", ".join(child_titles)}'
-                if len(non_functional) > 3:
-                    message += f' and {len(non_functional) - 3} more'
-                message += '. Are you sure you want to proceed?'
-                return jsonify({'success': False, 'warning': True, 'message': message})
             children = task.children.all()
-            if children and new_status == 'integrated':
-                non_integrated = [child for child in children if child.status != 'integrated']
-                if non_integrated:
-                    child_titles = [child.title for child in non_integrated[:3]]
-                    message = f'Cannot integrate while children are not integrated: {", ".join(child_titles)}'
-                    if len(non_integrated) > 3:
-                        message += f' and {len(non_integrated) - 3} more'
-                    return jsonify({'success': False, 'message': message})
+            checked_versions.update((child.id, child.version) for child in children)
+            problem = check_status_change(new_status, [(child.title, child.status) for child in children], override)
+            if problem:
+                message, warning = problem
+                if warning:
+                    return jsonify({'success': False, 'warning': True, 'message': message})
+                return jsonify({'success': False, 'message': message})
             if override:
                 task.override_warning = True
+            now = datetime.utcnow()
+            record_flow_transitions([(task.id, task.status, new_status, now)])
             history = StatusHistory(
                 task_id=task.id,
                 old_status=task.status,
                 new_status=new_status,
-                user_id=current_user.id
+                user_id=current_user.id,
+                timestamp=now
             )
             db.session.add(history)
             task.status = new_status
+            record_change('task_status', task_id=task.id)
+            refresh_rollups([task.id] + [p.id for p in task.parents])
     if 'documentation' in data:
         if not task.documentation:
             task.documentation = Documentation(task_id=task.id)
         task.documentation.content = data['documentation']
+    if 'title' in data or 'description' in data or 'documentation' in data:
+        index_task_text(task.id, task.title, task.description,
+                        task.documentation.content if task.documentation else '')
+    # Always write the task row, so documentation-only edits are version-checked too
+    task.updated_at = datetime.utcnow()
+    record_change('task_updated', task_id=task.id)
+    verify_versions(checked_versions)
     db.session.commit()
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'version': task.version})
 
 @app.route('/api/task/<int:task_id>', methods=['DELETE'])
 @login_required
+@retry_on_conflict
 def delete_task(task_id):
     task = Task.query.get_or_404(task_id)
     if current_user.role != 'admin' and task.creator_id != current_user.id:
         return jsonify({'success': False, 'message': 'Permission denied'}), 403
     if task.children.count() > 0:
         return jsonify({'success': False, 'message': 'Cannot delete task with children'})
+    parent_ids = [parent.id for parent in task.parents]
+    for parent_id in parent_ids:
+        record_change('edge_removed', parent_id=parent_id, child_id=task.id)
+    record_change('task_deleted', task_id=task.id)
+    index_task_removed(task.id)
+    unindex_task_text(task.id)
+    remove_task_flow(task.id)
     db.session.delete(task)
+    refresh_rollups(parent_ids)
     db.session.commit()
     return jsonify({'success': True})
 
 @app.route('/api/task/<int:task_id>/request', methods=['POST'])
 @login_required
 def request_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    if task.assignee_id:
-        return jsonify({'success': False, 'message': 'Task already assigned'})
-    if task.status != 'not_started':
+    if not claim_task(task_id, current_user.id):
+        db.session.rollback()
+        task = Task.query.get_or_404(task_id)
+        if task.assignee_id:
+            return conflict_response('Task already assigned')
         return jsonify({'success': False, 'message': 'Can only request not started tasks'})
-    task.assignee_id = current_user.id
+    record_change('task_assigned', task_id=task_id)
     db.session.commit()
     return jsonify({'success': True})
 
 @app.route('/api/task/<int:task_id>/assign', methods=['POST'])
 @login_required
+@retry_on_conflict
 def assign_task(task_id):
     if current_user.role != 'admin':
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
@@ -446,11 +4203,13 @@ def assign_task(task_id):
         task.assignee_id = user_id
     else:
         task.assignee_id = None
+    record_change('task_assigned', task_id=task.id)
     db.session.commit()
     return jsonify({'success': True})
 
 @app.route('/api/task/<int:task_id>/children', methods=['POST'])
 @login_required
+@retry_on_conflict
 def add_child(task_id):
     task = Task.query.get_or_404(task_id)
     child_id = request.json.get('child_id')
@@ -463,12 +4222,15 @@ def add_child(task_id):
         return jsonify({'success': False, 'message': 'Child task not found'})
     if child in task.children:
         return jsonify({'success': False, 'message': 'Task is already a child'})
-    child.parents.append(task)
+    if creates_cycle(task.id, child.id):
+        return jsonify({'success': False, 'message': 'Circular relationship detected'})
+    link_tasks(task, child)
     db.session.commit()
     return jsonify({'success': True})
 
 @app.route('/api/task/<int:task_id>/parents', methods=['POST'])
 @login_required
+@retry_on_conflict
 def add_parent(task_id):
     task = Task.query.get_or_404(task_id)
     parent_id = request.json.get('parent_id')
@@ -479,61 +4241,178 @@ def add_parent(task_id):
     parent = Task.query.get(parent_id)
     if not parent:
         return jsonify({'success': False, 'message': 'Parent task not found'})
-    task.parents.append(parent)
+    if parent in task.parents:
+        return jsonify({'success': False, 'message': 'Task is already a parent'})
+    if creates_cycle(parent.id, task.id):
+        return jsonify({'success': False, 'message': 'Circular relationship detected'})
+    link_tasks(parent, task)
     db.session.commit()
     return jsonify({'success': True})
 
 @app.route('/api/task/<int:task_id>/parents/<int:parent_id>', methods=['DELETE'])
 @login_required
+@retry_on_conflict
 def remove_parent(task_id, parent_id):
     task = Task.query.get_or_404(task_id)
     parent = Task.query.get(parent_id)
     if not parent:
         return jsonify({'success': False, 'message': 'Parent task not found'})
     if parent in task.parents:
-        task.parents.remove(parent)
+        unlink_tasks(parent, task)
         db.session.commit()
     return jsonify({'success': True})
 
+@app.route('/api/events')
+@login_required
+def events():
+    if not event_broker.open_stream():
+        response = jsonify({'success': False, 'message': 'Too many open event streams; poll /api/tasks?since=',
+                            'poll_seconds': app.config['EVENT_POLL_SECONDS']})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(app.config['EVENT_POLL_SECONDS'])
+        return response
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_event_id', type=int)
+    replay = []
+    missed = False
+    if last_id is None:
+        last_id = get_graph_version()
+    else:
+        oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+        if oldest is not None and last_id < oldest - 1:
+            missed = True
+            last_id = get_graph_version()
+        else:
+            replay = [serialize_change(entry) for entry in
+                      ChangeLog.query.filter(ChangeLog.id > last_id).order_by(ChangeLog.id)]
+    db.session.remove()
+    response = app.response_class(stream_events(last_id, replay, missed), mimetype='text/event-stream',
+                                  headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(event_broker.close_stream)
+    return response
+
+@app.route('/api/batch', methods=['POST'])
+@login_required
+@retry_on_conflict
+def batch():
+    operations = (request.json or {}).get('operations')
+    if not isinstance(operations, list):
+        return jsonify({'success': False, 'message': 'Operations list required'})
+    ref_ids, errors = apply_batch(operations, current_user)
+    if errors:
+        return jsonify({'success': False, 'message': f'{len(errors)} operations failed validation',
+                        'errors': errors})
+    return jsonify({'success': True, 'task_ids': ref_ids})
+
+@app.route('/api/export')
+@login_required
+def export():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    compress = request.args.get('gzip', type=int) == 1
+    if request.args.get('async', type=int) == 1:
+        # An export of the same graph version that has not finished yet is the same file
+        job = enqueue_job('export', {'compress': compress}, key=f'export:{get_graph_version()}:{int(compress)}',
+                          coalesce=('queued', 'running'))
+        db.session.commit()
+        return jsonify({'success': True, 'job': serialize_job(job)}), 202
+    filename = 'projtree-export.ndjson' + ('.gz' if compress else '')
+    return app.response_class(
+        stream_with_context(iter_export_chunks(compress, lines=iter_export_lines(include_secrets=False))),
+        mimetype='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/api/jobs', methods=['GET', 'POST'])
+@login_required
+def jobs():
+    if request.method == 'POST':
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Admin access required'}), 403
+        data = request.json or {}
+        params = data.get('params') or {}
+        if data.get('kind') not in JOB_KINDS or not isinstance(params, dict):
+            return jsonify({'success': False, 'message': f'Job kind must be one of {", ".join(sorted(JOB_KINDS))}'}), 400
+        job = enqueue_job(data['kind'], params)
+        db.session.commit()
+        return jsonify({'success': True, 'job': serialize_job(job)}), 202
+    query = Job.query
+    if current_user.role != 'admin':
+        query = query.filter_by(created_by=current_user.id)
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    return jsonify({'jobs': [serialize_job(job) for job in query.order_by(Job.id.desc()).limit(limit)]})
+
+def load_job(job_id):
+    """The job if the current user may see it, else an error response."""
+    job = Job.query.get_or_404(job_id)
+    if current_user.role != 'admin' and job.created_by != current_user.id:
+        return None, (jsonify({'success': False, 'message': 'Permission denied'}), 403)
+    return job, None
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def get_job(job_id):
+    job, error = load_job(job_id)
+    if error:
+        return error
+    return jsonify(serialize_job(job))
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job_route(job_id):
+    job, error = load_job(job_id)
+    if error:
+        return error
+    if job.status not in ('queued', 'running'):
+        return jsonify({'success': False, 'message': f'Job already {job.status}'})
+    cancel_job(job)
+    return jsonify({'success': True, 'job': serialize_job(job)})
+
+@app.route('/api/jobs/<int:job_id>/download')
+@login_required
+def download_job(job_id):
+    job, error = load_job(job_id)
+    if error:
+        return error
+    path = job_export_path(job) if job.status == 'succeeded' else None
+    if not path or not os.path.exists(path):
+        return jsonify({'success': False, 'message': 'No download for this job'}), 404
+    return send_from_directory(app.config['JOB_EXPORT_DIR'], os.path.basename(path), as_attachment=True)
+
 @app.route('/api/search')
 @login_required
 def search():
     query = request.args.get('q', '')
-    if not query:
-        return jsonify([])
-    tasks = Task.query.filter(
-        or_(
-            Task.title.ilike(f'%{query}%'),
-            Task.description.ilike(f'%{query}%')
-        )
-    ).all()
-    results = []
-    for task in tasks:
-        doc_preview = ''
-        if task.documentation and task.documentation.content:
-            doc_preview = task.documentation.content[:200]
-        results.append({
-            'id': task.id,
-            'title': task.title,
-            'description': task.description[:100] if task.description else '',
-            'doc_preview': doc_preview,
-            'status': task.status
-        })
-    return jsonify(results)
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    try:
+        results, next_cursor = search_tasks(query, limit, request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+    # The body stays a plain list; the next page is fetched with ?cursor=<X-Next-Cursor>
+    response = jsonify(results)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    my_tasks = Task.query.filter_by(assignee_id=current_user.id).all()
-    recent = Task.query.order_by(Task.updated_at.desc()).limit(10).all()
-    return render_template('dashboard.html', my_tasks=my_tasks, recent=recent)
+    version = get_graph_version()
+    return render_template('dashboard.html', my_tasks_html=dashboard_cache.my_tasks(current_user.id, version),
+                           recent_html=dashboard_cache.recent_activity(version))
 
 @app.route('/setup_db')
 def setup_db():
-    db.create_all()
+    run_migrations()
     if not User.query.filter_by(username='admin').first():
-        admin = User(username='admin', role='admin')
-        admin.set_password('admin123')
+        try:
+            password_hash = password_hasher.generate('admin123')
+        except TimeoutError:
+            return hasher_busy_response('Server busy, please try again')
+        admin = User(username='admin', role='admin', password_hash=password_hash)
         db.session.add(admin)
         db.session.commit()
         return 'Database created and admin user added (username: admin, password: admin123)'
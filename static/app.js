@@ -6,9 +6,9 @@ let parentTasksList = [];
 let dependencyTasksList = [];
 let currentMode = 'graph';
 let currentFilter = 'my';
-let currentSimulation = null;
 let svg = null;
 let g = null;
+let graphVersion = null;
 
 const current_user_role = document.body.dataset.userRole || 'developer';
 const current_user_id = parseInt(document.body.dataset.userId) || 0;
@@ -31,9 +31,48 @@ const statusLabels = {
 
 document.addEventListener('DOMContentLoaded', () => {
     setupEventListeners();
-    loadTasks();
+    loadTasks().then(subscribeToEvents);
 });
 
+let eventReloadTimer = null;
+
+function subscribeToEvents() {
+    const source = new EventSource(`/api/events?last_event_id=${graphVersion}`);
+    const scheduleReload = () => {
+        clearTimeout(eventReloadTimer);
+        eventReloadTimer = setTimeout(loadTasks, 250);
+    };
+    ['task_created', 'task_updated', 'task_status', 'task_deleted', 'task_assigned',
+     'edge_added', 'edge_removed', 'user_changed', 'rollups_recomputed', 'data_rebuilt'].forEach(kind => {
+        source.addEventListener(kind, (e) => {
+            if (parseInt(e.lastEventId) > graphVersion) scheduleReload();
+        });
+    });
+    source.addEventListener('resync', () => {
+        graphVersion = null;
+        scheduleReload();
+    });
+    source.onerror = () => {
+        // The server turns streams away past its cap (503); poll deltas until a slot frees up
+        if (source.readyState === EventSource.CLOSED) pollForChanges();
+    };
+}
+
+let eventPollTimer = null;
+
+function pollForChanges() {
+    if (eventPollTimer) return;
+    let polls = 0;
+    eventPollTimer = setInterval(() => {
+        loadTasks();
+        if (++polls >= 12) {
+            clearInterval(eventPollTimer);
+            eventPollTimer = null;
+            subscribeToEvents();
+        }
+    }, 5000);
+}
+
     document.querySelectorAll('.mode-btn').forEach(btn => {
         btn.addEventListener('click', (e) => {
             document.querySelectorAll('.mode-btn').forEach(b => b.classList.remove('active'));
@@ -89,9 +128,32 @@ function switchMode(mode) {
     }
 }
 
-async function loadTasks() {
+async function fetchTasks() {
+    if (graphVersion !== null) {
+        const resp = await fetch(`/api/tasks?since=${graphVersion}`);
+        const delta = await resp.json();
+        graphVersion = delta.version;
+        if (delta.full) {
+            return delta.tasks;
+        }
+        const removed = new Set(delta.removed_task_ids);
+        const updated = new Map(delta.tasks.map(task => [task.id, task]));
+        const merged = tasks
+            .filter(task => !removed.has(task.id))
+            .map(task => updated.get(task.id) || task);
+        const known = new Set(merged.map(task => task.id));
+        delta.tasks.forEach(task => {
+            if (!known.has(task.id)) merged.push(task);
+        });
+        return merged.sort((a, b) => a.id - b.id);
+    }
     const resp = await fetch('/api/tasks');
-    tasks = await resp.json();
+    graphVersion = parseInt(resp.headers.get('X-Graph-Version')) || 0;
+    return await resp.json();
+}
+
+async function loadTasks() {
+    tasks = await fetchTasks();
     
     tasks.forEach(task => {
         if (!task.parent_ids) task.parent_ids = [];
@@ -271,10 +333,18 @@ async function takeTask(taskId) {
     }
 }
 
-function renderGraph(taskId) {
+const GRAPH_DEPTH = 10;
+let graphRequest = 0;
+
+async function renderGraph(taskId) {
     const task = tasks.find(t => t.id === taskId);
     if (!task) return;
     
+    const request = ++graphRequest;
+    const resp = await fetch(`/api/task/${taskId}/subgraph?up=${GRAPH_DEPTH}&down=0`);
+    const subgraph = await resp.json();
+    if (request !== graphRequest) return;
+    
     const container = document.getElementById('graphContainer');
     container.innerHTML = '';
     
@@ -290,38 +360,17 @@ function renderGraph(taskId) {
     
     const levels = [];
     const taskToLevel = new Map();
+    const truncated = new Set(subgraph.truncated_up);
     
-    function calculateLevels(currentTask, currentLevel) {
-        if (taskToLevel.has(currentTask.id)) {
-            if (currentLevel > taskToLevel.get(currentTask.id)) {
-                taskToLevel.set(currentTask.id, currentLevel);
-            }
-        } else {
-            taskToLevel.set(currentTask.id, currentLevel);
-        }
-        
-        if (currentTask.parent_ids) {
-            currentTask.parent_ids.forEach(parentId => {
-                const parentTask = tasks.find(t => t.id === parentId);
-                if (parentTask) {
-                    calculateLevels(parentTask, currentLevel + 1);
-                }
-            });
-        }
-    }
-    
-    calculateLevels(task, 0);
+    subgraph.nodes.forEach(node => taskToLevel.set(node.id, node.level));
     
     const maxDepth = Math.max(...Array.from(taskToLevel.values()));
     for (let i = 0; i <= maxDepth; i++) {
         levels.push([]);
     }
     
-    taskToLevel.forEach((level, taskId) => {
-        const task = tasks.find(t => t.id === taskId);
-        if (task) {
-            levels[level].push(task);
-        }
+    subgraph.nodes.forEach(node => {
+        levels[node.level].push(node);
     });
     
     levels.forEach((level, levelIndex) => {
@@ -331,6 +380,17 @@ function renderGraph(taskId) {
         
         level.forEach(t => {
             const node = createGraphNode(t);
+            if (truncated.has(t.id)) {
+                node.classList.add('truncated');
+                const more = document.createElement('button');
+                more.className = 'graph-node-more';
+                more.textContent = 'More \u2191';
+                more.addEventListener('click', (e) => {
+                    e.stopPropagation();
+                    selectTaskFromList(t.id);
+                });
+                node.appendChild(more);
+            }
             levelDiv.appendChild(node);
         });
         
@@ -480,7 +540,11 @@ function createGraphNode(task) {
     return node;
 }
 
-function renderTree() {
+async function renderTree() {
+    const resp = await fetch('/api/layout');
+    const layout = await resp.json();
+    const positions = new Map(layout.nodes.map(n => [n.id, n]));
+
     if (!svg) {
         svg = d3.select('#treeCanvas');
         svg.selectAll('*').remove();
@@ -505,8 +569,11 @@ function renderTree() {
     const links = [];
 
     tasks.forEach(task => {
+        const position = positions.get(task.id) || { x: 0, y: 0 };
         nodes.push({
             id: task.id,
+            x: position.x,
+            y: position.y,
             title: task.title,
             status: task.status,
             progress: task.progress,
@@ -516,27 +583,14 @@ function renderTree() {
         });
     });
 
-    tasks.forEach(task => {
-        if (task.parent_ids) {
-            task.parent_ids.forEach(parentId => {
-                links.push({
-                    source: parentId,
-                    target: task.id
-                });
-            });
-        }
+    layout.edges.forEach(edge => {
+        links.push({
+            source: edge.source,
+            target: edge.target,
+            points: edge.points
+        });
     });
 
-    if (currentSimulation) {
-        currentSimulation.stop();
-    }
-
-    currentSimulation = d3.forceSimulation(nodes)
-        .force('link', d3.forceLink(links).id(d => d.id).distance(120))
-        .force('charge', d3.forceManyBody().strength(-800))
-        .force('center', d3.forceCenter(width / 2, height / 2))
-        .force('collision', d3.forceCollide().radius(50));
-
     if (!svg.select('defs #arrowhead').node()) {
         svg.append('defs').append('marker')
             .attr('id', 'arrowhead')
@@ -552,9 +606,11 @@ function renderTree() {
     }
 
     const link = g.append('g')
-        .selectAll('line')
+        .selectAll('path')
         .data(links)
-        .enter().append('line')
+        .enter().append('path')
+        .attr('d', d => d3.line()(d.points))
+        .attr('fill', 'none')
         .attr('stroke', '#3a3a3a')
         .attr('stroke-width', 2)
         .attr('marker-end', 'url(#arrowhead)');
@@ -574,11 +630,7 @@ function renderTree() {
             event.preventDefault();
             selectTaskFromList(d.id);
             showContextMenu(event.pageX, event.pageY);
-        })
-        .call(d3.drag()
-            .on('start', dragstarted)
-            .on('drag', dragged)
-            .on('end', dragended));
+        });
 
     node.each(function(d) {
         const nodeGroup = d3.select(this);
@@ -656,42 +708,15 @@ function renderTree() {
         }
     });
 
-    currentSimulation.on('tick', () => {
-        link
-            .attr('x1', d => d.source.x)
-            .attr('y1', d => d.source.y)
-            .attr('x2', d => d.target.x)
-            .attr('y2', d => d.target.y);
-
-        node.attr('transform', d => `translate(${d.x}, ${d.y})`);
-    });
-
-    function dragstarted(event, d) {
-        if (!event.active) currentSimulation.alphaTarget(0.3).restart();
-        d.fx = d.x;
-        d.fy = d.y;
-    }
-
-    function dragged(event, d) {
-        d.fx = event.x;
-        d.fy = event.y;
-    }
-
-    function dragended(event, d) {
-        if (!event.active) currentSimulation.alphaTarget(0);
-        d.fx = null;
-        d.fy = null;
-    }
+    node.attr('transform', d => `translate(${d.x}, ${d.y})`);
 
     if (!window.initialZoomDone) {
-        setTimeout(() => {
-            const bbox = g.node().getBBox();
-            const scale = Math.min(width / bbox.width, height / bbox.height, 1) * 0.8;
-            const translateX = (width - bbox.width * scale) / 2 - bbox.x * scale;
-            const translateY = (height - bbox.height * scale) / 2 - bbox.y * scale;
-            svg.call(svg.on('zoom').transform, d3.zoomIdentity.translate(translateX, translateY).scale(scale));
-            window.initialZoomDone = true;
-        }, 500);
+        const bbox = g.node().getBBox();
+        const scale = Math.min(width / bbox.width, height / bbox.height, 1) * 0.8;
+        const translateX = (width - bbox.width * scale) / 2 - bbox.x * scale;
+        const translateY = (height - bbox.height * scale) / 2 - bbox.y * scale;
+        svg.call(svg.on('zoom').transform, d3.zoomIdentity.translate(translateX, translateY).scale(scale));
+        window.initialZoomDone = true;
     }
 }
 
@@ -726,6 +751,31 @@ function showContextMenu(x, y) {
     menu.style.top = y + 'px';
 }
 
+// History arrives a page at a time, oldest first; it is shown newest first
+function appendHistory(historyList, taskId, entries, cursor) {
+    entries.slice().reverse().forEach(h => {
+        const item = document.createElement('div');
+        item.className = 'history-item';
+        item.innerHTML = `
+            <div><strong>${statusLabels[h.old_status]}</strong> → <strong>${statusLabels[h.new_status]}</strong></div>
+            <div class="time">${h.user} • ${new Date(h.timestamp).toLocaleString()}</div>
+        `;
+        historyList.appendChild(item);
+    });
+    if (cursor) {
+        const more = document.createElement('button');
+        more.className = 'btn btn-secondary';
+        more.textContent = 'Show older';
+        more.onclick = async () => {
+            more.remove();
+            const resp = await fetch(`/api/task/${taskId}/history?cursor=${cursor}`);
+            const page = await resp.json();
+            appendHistory(historyList, taskId, page.history, page.next_cursor);
+        };
+        historyList.appendChild(more);
+    }
+}
+
 async function viewTaskDetails() {
     const resp = await fetch(`/api/task/${selectedTask}`);
     const task = await resp.json();
@@ -816,15 +866,7 @@ async function viewTaskDetails() {
     const historyList = document.getElementById('historyList');
     historyList.innerHTML = '';
     if (task.history && task.history.length > 0) {
-        task.history.reverse().forEach(h => {
-            const item = document.createElement('div');
-            item.className = 'history-item';
-            item.innerHTML = `
-                <div><strong>${statusLabels[h.old_status]}</strong> → <strong>${statusLabels[h.new_status]}</strong></div>
-                <div class="time">${h.user} • ${new Date(h.timestamp).toLocaleString()}</div>
-            `;
-            historyList.appendChild(item);
-        });
+        appendHistory(historyList, task.id, task.history, task.history_cursor);
     } else {
         historyList.innerHTML = '<span style="color: var(--text-dim);">No history yet</span>';
     }
@@ -850,12 +892,12 @@ async function updateTaskStatus(newStatus) {
     const resp = await fetch(`/api/task/${currentDetailTask.id}`, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ status: newStatus })
+        body: JSON.stringify({ status: newStatus, version: currentDetailTask.version })
     });
     const data = await resp.json();
     
     if (data.warning) {
-        pendingStatusUpdate = { taskId: currentDetailTask.id, status: newStatus };
+        pendingStatusUpdate = { taskId: currentDetailTask.id, status: newStatus, version: currentDetailTask.version };
         showWarningModal(data.message);
     } else if (data.success) {
         showFlash('Status updated', 'success');
@@ -863,6 +905,7 @@ async function updateTaskStatus(newStatus) {
         await viewTaskDetails();
     } else {
         showFlash(data.message, 'error');
+        if (data.conflict) await viewTaskDetails();
     }
 }
 
@@ -884,7 +927,8 @@ async function confirmWarningAction() {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ 
             status: pendingStatusUpdate.status,
-            override_warning: true
+            override_warning: true,
+            version: pendingStatusUpdate.version
         })
     });
     const data = await resp.json();
@@ -919,10 +963,11 @@ async function saveDocumentation() {
     const resp = await fetch(`/api/task/${currentDetailTask.id}`, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ documentation: content })
+        body: JSON.stringify({ documentation: content, version: currentDetailTask.version })
     });
     const data = await resp.json();
     if (data.success) {
+        currentDetailTask.version = data.version;
         showFlash('Documentation saved', 'success');
         closeDocumentationModal();
     } else {
@@ -975,6 +1020,8 @@ async function saveTask(e) {
 
     let resp;
     if (taskId) {
+        const task = tasks.find(t => t.id === Number(taskId));
+        if (task) data.version = task.version;
         resp = await fetch(`/api/task/${taskId}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
@@ -990,6 +1037,9 @@ async function saveTask(e) {
 
     const result = await resp.json();
     if (result.success) {
+        if (taskId && currentDetailTask && currentDetailTask.id === Number(taskId)) {
+            currentDetailTask.version = result.version;
+        }
         showFlash(taskId ? 'Task updated' : 'Task created', 'success');
         closeTaskModal();
         await loadTasks();